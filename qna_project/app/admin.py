@@ -1,11 +1,12 @@
 from django.contrib import admin
 
-from app.models import Question, Answer, Tag, Profile, QuestionVote, AnswerVote
+from app.models import Question, Answer, Tag, Profile, ProfileStats, QuestionVote, AnswerVote
 
 admin.site.register(Question)
 admin.site.register(Answer)
 admin.site.register(Tag)
 admin.site.register(Profile)
+admin.site.register(ProfileStats)
 admin.site.register(QuestionVote)
 admin.site.register(AnswerVote)
 
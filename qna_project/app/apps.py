@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+    
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from .routers import install_latency_hook
+        install_latency_hook()
@@ -0,0 +1,67 @@
+"""
+The live question page stream of the ASGI deployment, routed by qna_project.urls_async
+(opt-in, see qna_project/asgi.py). Pages are served by the sync views in app.views
+under both WSGI and ASGI; only a stream that stays open for minutes needs to be async.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponseNotFound, StreamingHttpResponse
+
+from . import events
+from .models import Question
+
+
+def _closing_connections(func):
+    def run(*args):
+        try:
+            return func(*args)
+        finally:
+            # pool threads outlive the request, so apply CONN_MAX_AGE like request_finished does
+            for connection in connections.all(initialized_only=True):
+                connection.close_if_unusable_or_obsolete()
+    return run
+
+
+def in_thread(func, *args):
+    return sync_to_async(_closing_connections(func), thread_sensitive=False)(*args)
+
+
+async def event_stream(topic):
+    # subscribes on the first read: a response that is never streamed holds nothing
+    subscription = events.subscribe(topic)
+    try:
+        # EventSource reconnects after this many ms when the stream ends
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                frame = await asyncio.wait_for(subscription.queue.get(), settings.EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # keeps proxies from closing an idle stream
+                yield ': keep-alive\n\n'
+                continue
+            if frame is events.EVICTED:
+                yield events.sse_frame('evicted', {})
+                return
+            yield frame
+    finally:
+        # also runs when the client disconnects and Django cancels the response
+        events.hub.unsubscribe(subscription)
+
+
+async def question_events(request, question_id):
+    """New answers and rating changes of a question as Server-Sent Events."""
+    # a pool thread, not the request's thread-sensitive one: an open stream must not hold a connection
+    if not await in_thread(Question.objects.filter(id=question_id).exists):
+        return HttpResponseNotFound('<h1>Question not found</h1>')
+
+    response = StreamingHttpResponse(
+        event_stream(events.topic_for(question_id)),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # nginx would buffer the stream otherwise
+    response['X-Accel-Buffering'] = 'no'
+    return response
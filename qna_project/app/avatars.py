@@ -0,0 +1,85 @@
+"""
+Avatar thumbnails.
+
+Uploads are resized once, when they are saved, to the sizes the pages render
+(AVATAR_SIZES, 1x and 2x of the 64px cards). Variants are named after the
+hash of the source image, so a URL never changes its content and can be cached
+forever, and users uploading the same picture share the files. views.avatar_thumbnail
+serves them with a one year immutable Cache-Control; a web server serving
+MEDIA_ROOT in front of Django has to send the same header for avatars/thumbs/.
+"""
+import hashlib
+import io
+import re
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+AVATAR_SIZES = (64, 128)
+THUMBNAILS_DIR = 'avatars/thumbs'
+
+# what content_name() produces, anything else under THUMBNAILS_DIR isn't a variant
+NAME_PATTERN = re.compile(r'[0-9a-f]{32}\.(?:webp|png)')
+
+# bump to give every variant a new name when the resizing changes
+PIPELINE_VERSION = b'1'
+
+# Pillow builds without libwebp fall back to PNG
+FORMAT, EXTENSION = ('WEBP', 'webp') if features.check('webp') else ('PNG', 'png')
+
+
+def thumbnail_path(name, size):
+    return f'{THUMBNAILS_DIR}/{size}/{name}'
+
+
+def thumbnail_url(name, size):
+    return default_storage.url(thumbnail_path(name, size))
+
+
+def content_name(data):
+    digest = hashlib.sha256(PIPELINE_VERSION + data).hexdigest()[:32]
+    return f'{digest}.{EXTENSION}'
+
+
+def resize(image, size):
+    """Center-cropped square of `size` px, keeping transparency."""
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    image.save(output, FORMAT, **({'quality': 85, 'method': 6} if FORMAT == 'WEBP' else {'optimize': True}))
+    return output.getvalue()
+
+
+def make_thumbnails(field_file):
+    """
+    Writes the missing variants of an uploaded image and returns their common name,
+    or '' when the file isn't a readable image (pages then show the original).
+    """
+    with field_file.open('rb') as f:
+        data = f.read()
+    name = content_name(data)
+
+    missing = [size for size in AVATAR_SIZES if not default_storage.exists(thumbnail_path(name, size))]
+    if missing:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.load()
+                variants = {size: resize(image, size) for size in missing}
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+            return ''
+        for size, content in variants.items():
+            default_storage.save(thumbnail_path(name, size), ContentFile(content))
+    return name
+
+
+def update_thumbnails(profile):
+    """Regenerates the profile's variants from avatar_image and stores their name without a full save."""
+    name = make_thumbnails(profile.avatar_image) if profile.avatar_image else ''
+    if name != profile.avatar_thumbnail:
+        type(profile).objects.filter(pk=profile.pk).update(avatar_thumbnail=name)
+        profile.avatar_thumbnail = name
+    profile._stored_avatar_image = profile.avatar_image.name or ''
+    return name
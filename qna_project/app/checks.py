@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Page cache purges (app.surrogates) only reach the processes sharing the default cache."""
+    if settings.CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache':
+        return [Warning(
+            'The default cache is per process: a purge only invalidates the cached pages '
+            'of the worker that made the change, the others serve them until PAGE_CACHE_TTL.',
+            hint='Set QNA_CACHE_BACKEND to a cache every worker shares (db, or file on a single host).',
+            id='app.W001',
+        )]
+    return []
@@ -0,0 +1,87 @@
+"""
+Conditional GET for the pages tagged with surrogate keys (see app.surrogates).
+
+A rendered page gets an ETag and a Last-Modified, and the versions of the keys
+it was built from are remembered per URL and user for PAGE_CACHE_TTL (which
+also bounds how stale the sidebar inside a revalidated page can get). While
+all of those keys keep their versions, If-None-Match / If-Modified-Since is
+answered with 304 before the view runs: no ORM, no templates, only the cache
+and, for logged in clients, the session.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .surrogates import key_versions
+
+VALIDATOR_PREFIX = 'validator:'
+
+
+def validator_key(request):
+    # pages differ per user (navbar, csrf token); the session tells who without loading the user
+    user_id = request.session.get(SESSION_KEY, '')
+    url = f'{settings.ROOT_URLCONF} {user_id} {request.build_absolute_uri()}'
+    return VALIDATOR_PREFIX + hashlib.md5(url.encode()).hexdigest()
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # browsers revalidate instead of guessing how long the page stays fresh
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def not_modified(request):
+    """A 304 when the client's copy of the page is still current, else None."""
+    if request.method not in ('GET', 'HEAD') or not (
+        'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+    ):
+        return None
+    entry = cache.get(validator_key(request))
+    if entry is None or key_versions(list(entry['keys'])) != entry['keys']:
+        return None
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+    if response is None:
+        return None
+    return set_validators(response, entry['etag'], entry['last_modified'])
+
+
+def remember(request, response, started):
+    keys = getattr(request, 'surrogate_keys', None)
+    if request.method not in ('GET', 'HEAD') or not keys or response.status_code != 200 or response.streaming:
+        return response
+
+    # a page rendered while one of its keys was being purged may already be stale
+    versions = key_versions(sorted(keys), purged_after=started)
+    if versions is None:
+        return response
+    # AnonymousPageCacheMiddleware stores the page with these versions
+    request.surrogate_versions = versions
+    # the render time tells apart pages built from the same keys with a different sidebar
+    etag = '"%s"' % hashlib.md5(f'{started} {sorted(versions.items())}'.encode()).hexdigest()
+    last_modified = started // 1_000_000_000
+    cache.set(validator_key(request), {
+        'keys': versions,
+        'etag': etag,
+        'last_modified': last_modified,
+    }, settings.PAGE_CACHE_TTL)
+    return set_validators(response, etag, last_modified)
+
+
+def conditional_page(view):
+    """Answers revalidations of the view's pages with 304 while their surrogate keys are unchanged."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = not_modified(request)
+        if response is not None:
+            return response
+        started = time.time_ns()
+        return remember(request, view(request, *args, **kwargs), started)
+    return wrapper
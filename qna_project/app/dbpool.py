@@ -0,0 +1,22 @@
+from django.db import connections
+
+
+def pool_stats():
+    """
+    psycopg_pool statistics of every pooled database alias of this process,
+    plus `in_use` and `utilization` (connections handed out / max_size).
+    Aliases without a pool map to None.
+    """
+    stats = {}
+    for connection in connections.all():
+        pool = getattr(connection, 'pool', None)
+        if pool is None:
+            stats[connection.alias] = None
+            continue
+
+        alias_stats = pool.get_stats()
+        in_use = alias_stats.get('pool_size', 0) - alias_stats.get('pool_available', 0)
+        alias_stats['in_use'] = in_use
+        alias_stats['utilization'] = round(in_use / pool.max_size, 3)
+        stats[connection.alias] = alias_stats
+    return stats
@@ -0,0 +1,181 @@
+"""
+Live updates of question pages over Server-Sent Events (see app.async_views.question_events).
+
+Writes publish small events ("answer", "rating") to a topic per question once
+their transaction commits. EVENTS_BACKEND carries them to every worker process,
+where the EventHub fans them out to the open streams of that topic.
+
+Every stream has a bounded queue (EVENTS_QUEUE_SIZE). A client that doesn't
+read fast enough to keep it from filling up is evicted: its stream ends and
+EventSource reconnects, rather than the worker buffering for it without limit.
+An idle stream costs one queue and one waiting task (`manage.py bench_events`
+measures it), events are formatted once and shared by all of their subscribers.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('app.events')
+
+EVICTED = None
+
+
+def topic_for(question_id):
+    return f'question:{question_id}'
+
+
+def sse_frame(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+class Subscription:
+    __slots__ = ('topic', 'queue')
+
+    def __init__(self, topic, size):
+        self.topic = topic
+        self.queue = asyncio.Queue(maxsize=size)
+
+
+class EventHub:
+    """In-process pub/sub; all subscriber bookkeeping happens on the event loop thread."""
+    def __init__(self):
+        self.loop = None
+        self.topics = {}
+        self.evictions = 0
+
+    def subscribe(self, topic):
+        self.loop = asyncio.get_running_loop()
+        subscription = Subscription(topic, settings.EVENTS_QUEUE_SIZE)
+        self.topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscribers = self.topics.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.topics[subscription.topic]
+
+    def subscriber_count(self):
+        return sum(len(subscribers) for subscribers in self.topics.values())
+
+    def deliver(self, topic, frame):
+        for subscription in list(self.topics.get(topic, ())):
+            try:
+                subscription.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self.evict(subscription)
+
+    def evict(self, subscription):
+        self.unsubscribe(subscription)
+        self.evictions += 1
+        # the client has missed events anyway, make room for the sentinel
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(EVICTED)
+
+    def deliver_threadsafe(self, topic, frame):
+        """Delivers from any thread; a no-op in processes that serve no streams."""
+        loop = self.loop
+        if loop is None or loop.is_closed() or topic not in self.topics:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.deliver(topic, frame)
+        else:
+            loop.call_soon_threadsafe(self.deliver, topic, frame)
+
+
+hub = EventHub()
+
+
+class LocalBackend:
+    """
+    Fan-out inside one process: enough for a single ASGI worker and for tests.
+
+    Backends take the hub, start() is called once the process opens its first
+    stream, publish() from whatever thread committed the write.
+    """
+    def __init__(self, hub):
+        self.hub = hub
+
+    def start(self):
+        pass
+
+    def publish(self, topic, frame):
+        self.hub.deliver_threadsafe(topic, frame)
+
+
+class PostgresNotifyBackend:
+    """
+    Fan-out across processes and hosts with PostgreSQL LISTEN/NOTIFY.
+
+    Publishing is one pg_notify() on the publisher's connection; every process
+    with open streams runs one listener thread with its own connection, which
+    also receives the notifications of its own process.
+    """
+    CHANNEL = 'qna_events'
+    RECONNECT_DELAY = 1
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def start(self):
+        threading.Thread(target=self.listen, name='qna-events-listener', daemon=True).start()
+
+    def publish(self, topic, frame):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.CHANNEL, json.dumps([topic, frame])])
+
+    def listen(self):
+        import psycopg
+
+        # this thread's own connection settings, never a pooled connection
+        params = connection.get_connection_params()
+        while True:
+            try:
+                with psycopg.connect(**params, autocommit=True) as listener:
+                    listener.execute(f'LISTEN {self.CHANNEL}')
+                    for notify in listener.notifies():
+                        topic, frame = json.loads(notify.payload)
+                        self.hub.deliver_threadsafe(topic, frame)
+            except Exception:
+                logger.exception('event listener lost its connection')
+                time.sleep(self.RECONNECT_DELAY)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(settings.EVENTS_BACKEND)(hub)
+            _backend.started = False
+        return _backend
+
+
+def subscribe(topic):
+    """Opens a stream of the topic; must run on the event loop."""
+    backend = get_backend()
+    if not backend.started:
+        backend.started = True
+        backend.start()
+    return hub.subscribe(topic)
+
+
+def publish(topic, event, data):
+    """Sends the event to the topic's streams once the current transaction commits."""
+    frame = sse_frame(event, data)
+    transaction.on_commit(lambda: get_backend().publish(topic, frame))
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.contrib.humanize.templatetags.humanize import naturaltime
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+# stands in for the card's relative time ("3 minutes ago"), which is filled in
+# on every render instead of being cached; user content is escaped, so it can't contain it
+TIME_MARKER = mark_safe('<natural-time/>')
+
+
+def card_key(question):
+    profile_updated = question.profile.updated_at
+    return 'card:{}:{}:{}'.format(
+        question.pk,
+        question.version,
+        int(profile_updated.timestamp()) if profile_updated else 0,
+    )
+
+
+def render_card(question):
+    """The card as the (before, after) halves around its relative time."""
+    before, _, after = render_to_string('layout/card.html', {
+        'question': question,
+        'natural_time': TIME_MARKER,
+    }).partition(TIME_MARKER)
+    return before, after
+
+
+def render_cards(questions):
+    """
+    Renders layout/card.html for every question, taking what it can from the cache
+    with a single get_many and rendering (then storing) only the misses.
+    """
+    questions = list(questions)
+    keys = [card_key(question) for question in questions]
+    cached = cache.get_many(keys)
+
+    fragments = []
+    missing = {}
+    for question, key in zip(questions, keys):
+        halves = cached.get(key)
+        if halves is None:
+            halves = missing[key] = render_card(question)
+        before, after = halves
+        fragments += [before, escape(str(naturaltime(question.created_at))), after]
+
+    if missing:
+        cache.set_many(missing, settings.CARD_CACHE_TTL)
+
+    return mark_safe(''.join(fragments))
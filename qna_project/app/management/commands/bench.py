@@ -0,0 +1,238 @@
+import contextlib
+import io
+import json
+import logging
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_databases, teardown_databases
+from django.urls import URLPattern, get_resolver, reverse
+
+from app.models import Question, Answer, Tag, Profile
+
+DEFAULT_SCALES = '1,5'
+DEFAULT_ITERATIONS = 30
+DEFAULT_TOLERANCE = 0.25
+
+# ignore latency changes below this many milliseconds, they are noise on fast views
+LATENCY_SLACK_MS = 1.0
+
+# views that change data are benchmarked as logged-in POSTs
+POST_ROUTES = {
+    'vote_question': lambda i: {'value': 1 if i % 2 else -1},
+    'vote_answer': lambda i: {'value': 1 if i % 2 else -1},
+}
+
+# fill_db uploads no avatar images, so there are no thumbnails to request
+SKIPPED_ROUTES = {'avatar_thumbnail'}
+
+
+def percentile(samples, p):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[p - 1]
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every view on deterministic fill_db datasets in a throwaway test database; '
+            'optionally compare against a baseline JSON and fail on regressions')
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default=DEFAULT_SCALES,
+                            help='comma separated fill_db ratios, one dataset each')
+        parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--warm-cache', action='store_true',
+                            help="keep the cache between requests (default: clear it before each one)")
+        parser.add_argument('--views', default='', help='comma separated route names, default: all')
+        parser.add_argument('--output', help='write the results to this JSON file')
+        parser.add_argument('--baseline', help='compare against this JSON file and exit 1 on regressions')
+        parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                            help='allowed relative slowdown / memory growth, e.g. 0.25 = 25%%')
+
+
+    def handle(self, *args, **kwargs):
+        self.iterations = kwargs['iterations']
+        self.warmup = kwargs['warmup']
+        self.warm_cache = kwargs['warm_cache']
+        only = {name for name in kwargs['views'].split(',') if name}
+        scales = [int(scale) for scale in kwargs['scales'].split(',')]
+
+        if self.iterations < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        report = {
+            'meta': {
+                'seed': kwargs['seed'],
+                'iterations': self.iterations,
+                'warm_cache': self.warm_cache,
+                'vendor': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'results': {},
+        }
+
+        # profiling samples would add noise, the test server name has to be allowed;
+        # broken views are reported by their status, not by a traceback per request
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver'], REQUEST_PROFILING_SAMPLE_RATE=0):
+                for scale in scales:
+                    report['results'][str(scale)] = self.bench_scale(scale, kwargs['seed'], only)
+        finally:
+            request_logger.setLevel(level)
+
+        output = json.dumps(report, indent=2)
+        if kwargs['output']:
+            with open(kwargs['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(f'Results written to {kwargs["output"]}')
+        else:
+            self.stdout.write(output)
+
+        if kwargs['baseline']:
+            with open(kwargs['baseline']) as f:
+                baseline = json.load(f)
+            regressions = self.compare(baseline, report, kwargs['tolerance'])
+            for regression in regressions:
+                self.stderr.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) against {kwargs["baseline"]}')
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+
+    def bench_scale(self, scale, seed, only):
+        self.stderr.write(f'Seeding scale {scale}...')
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            # fill_db's progress bars write straight to sys.stdout
+            with contextlib.redirect_stdout(io.StringIO()):
+                call_command('fill_db', scale, seed=seed, stdout=io.StringIO())
+
+            results = {}
+            for name, method, path, data in self.requests(only):
+                self.stderr.write(f'  {name} {method} {path}')
+                results[name] = self.bench_view(method, path, data)
+            return results
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+
+    def requests(self, only):
+        """(route name, method, path, data factory) for every route of the root URLconf."""
+        question = Question.objects.order_by('-answers_count', 'pk').first()
+        answer = Answer.objects.order_by('pk').first()
+        tag = Tag.objects.most_popular().first()
+        profile = Profile.objects.most_active().select_related('user').first()
+        if not (question and answer and tag and profile):
+            raise CommandError('fill_db produced an empty dataset')
+
+        samples = {
+            'question_id': question.pk,
+            'answer_id': answer.pk,
+            'tag': tag.name,
+            'username': profile.user.username,
+        }
+        self.voter = profile.user
+
+        for pattern in get_resolver().url_patterns:
+            # skips include()s, i.e. the admin
+            if not isinstance(pattern, URLPattern) or not pattern.name or pattern.name in SKIPPED_ROUTES:
+                continue
+            if only and pattern.name not in only:
+                continue
+
+            kwargs = {param: samples[param] for param in pattern.pattern.converters}
+            path = reverse(pattern.name, kwargs=kwargs)
+            if pattern.name == 'search':
+                path += '?q=' + question.title.split()[0]
+            elif pattern.name == 'suggest_tags':
+                # a prefix as typed, without one the view answers without touching the index
+                path += '?prefix=' + tag.name[:2]
+
+            if pattern.name in POST_ROUTES:
+                yield pattern.name, 'post', path, POST_ROUTES[pattern.name]
+            else:
+                yield pattern.name, 'get', path, None
+
+
+    def bench_view(self, method, path, data):
+        client = Client(raise_request_exception=False)
+        if method == 'post':
+            client.force_login(self.voter)
+
+        def send(i):
+            if not self.warm_cache:
+                cache.clear()
+            if data is None:
+                return client.get(path)
+            return getattr(client, method)(path, data(i))
+
+        for i in range(self.warmup):
+            send(i)
+
+        timings, queries = [], []
+        for i in range(self.iterations):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = send(i)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+
+        # a separate pass, tracemalloc slows every allocation down
+        peak = 0
+        tracemalloc.start()
+        try:
+            for i in range(min(3, self.iterations)):
+                tracemalloc.reset_peak()
+                send(i)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'method': method.upper(),
+            'path': path,
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'queries': max(queries),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+
+    def compare(self, baseline, report, tolerance):
+        regressions = []
+        for scale, views in report['results'].items():
+            for name, current in views.items():
+                previous = baseline.get('results', {}).get(scale, {}).get(name)
+                if previous is None:
+                    continue
+
+                label = f'scale {scale} {name}'
+                if current['status'] != previous['status']:
+                    regressions.append(f'{label}: status {previous["status"]} -> {current["status"]}')
+                # query counts are deterministic, any growth is a regression
+                if current['queries'] > previous['queries']:
+                    regressions.append(f'{label}: queries {previous["queries"]} -> {current["queries"]}')
+                for metric in ('p50_ms', 'p95_ms'):
+                    limit = previous[metric] * (1 + tolerance) + LATENCY_SLACK_MS
+                    if current[metric] > limit:
+                        regressions.append(f'{label}: {metric} {previous[metric]} -> {current[metric]}')
+                if current['peak_kb'] > previous['peak_kb'] * (1 + tolerance):
+                    regressions.append(f'{label}: peak_kb {previous["peak_kb"]} -> {current["peak_kb"]}')
+        return regressions
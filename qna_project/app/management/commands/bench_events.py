@@ -0,0 +1,94 @@
+import asyncio
+import gc
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import events
+from app.async_views import event_stream
+
+
+class Command(BaseCommand):
+    help = ('Measure idle live-event streams (app.events): memory per open stream, one fan-out '
+            'to all of them, and that the hub drops every queue once the clients disconnect')
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=10_000)
+        parser.add_argument('--topics', type=int, default=100,
+                            help='questions the streams are spread over')
+
+
+    def handle(self, *args, **kwargs):
+        if kwargs['subscribers'] < 1 or kwargs['topics'] < 1:
+            raise CommandError('--subscribers and --topics must be at least 1')
+
+        report = asyncio.run(self.measure(kwargs['subscribers'], kwargs['topics']))
+
+        self.stdout.write(f'{report["subscribers"]} streams over {report["topics"]} topics')
+        self.stdout.write(f'open: {report["per_stream_kb"]:.2f} KB per stream, '
+                          f'{report["open_mb"]:.1f} MB in total')
+        self.stdout.write(f'fan-out of one event to every stream: {report["fan_out_ms"]:.0f} ms')
+        self.stdout.write(f'after disconnect: {report["subscriber_count"]} subscribers, '
+                          f'{report["retained_kb"]:.1f} KB retained')
+        if report['subscriber_count'] or report['leftover_topics']:
+            raise CommandError(f'the hub kept {report["subscriber_count"]} subscriber(s) '
+                               f'in {report["leftover_topics"]} topic(s) after the streams closed')
+
+
+    async def measure(self, count, topics):
+        """Runs on a fresh event loop, the streams are the ones question_events returns."""
+        names = [events.topic_for(question_id) for question_id in range(1, topics + 1)]
+        received = 0
+
+        async def client(stream):
+            # what Django does with a StreamingHttpResponse: read until the client goes away
+            nonlocal received
+            async for frame in stream:
+                if frame.startswith('event:'):
+                    received += 1
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            tasks = [
+                asyncio.ensure_future(client(event_stream(names[i % topics])))
+                for i in range(count)
+            ]
+            # every stream sends its retry line and waits on its queue
+            for _ in range(3):
+                await asyncio.sleep(0)
+            opened = tracemalloc.get_traced_memory()[0] - before
+
+            frame = events.sse_frame('rating', {'id': 1, 'rating': 1})
+            started = time.perf_counter()
+            for name in names:
+                events.hub.deliver(name, frame)
+            while received < count:
+                await asyncio.sleep(0)
+            fan_out_ms = (time.perf_counter() - started) * 1000
+
+            # client disconnects: Django cancels the task reading the response
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            del tasks
+            # the loop lets go of the finished tasks on its next iteration
+            await asyncio.sleep(0)
+            gc.collect()
+            retained = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'subscribers': count,
+            'topics': topics,
+            'per_stream_kb': opened / count / 1024,
+            'open_mb': opened / 2 ** 20,
+            'fan_out_ms': fan_out_ms,
+            'subscriber_count': events.hub.subscriber_count(),
+            'leftover_topics': len(events.hub.topics),
+            'retained_kb': max(retained, 0) / 1024,
+        }
@@ -0,0 +1,93 @@
+import random
+import string
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+from app.management.commands.bench import percentile
+from app.models import Tag
+from app.tagindex import TagIndex, build_index
+
+
+class Command(BaseCommand):
+    help = ('Benchmark tag autocomplete: the in-process prefix index (app.tagindex) against '
+            'a LIKE query, on generated tags in a throwaway test database')
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tags', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+
+    def handle(self, *args, **kwargs):
+        rng = random.Random(kwargs['seed'])
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            names = self.seed(rng, kwargs['tags'])
+            self.report(rng, names, kwargs['queries'], kwargs['limit'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+
+    def seed(self, rng, count):
+        self.stderr.write(f'Creating {count} tags on {connection.vendor}...')
+        names = set()
+        while len(names) < count:
+            names.add(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12))))
+        names = sorted(names)
+        # long-tailed popularity, like real tags
+        Tag.objects.bulk_create(
+            (Tag(name=name, questions_count=int(rng.paretovariate(1.2))) for name in names),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return names
+
+
+    def report(self, rng, names, queries, limit):
+        started = time.perf_counter()
+        build_index()
+        build_ms = (time.perf_counter() - started) * 1000
+
+        rows = list(Tag.objects.values_list('pk', 'name', 'questions_count'))
+        tracemalloc.start()
+        index = TagIndex(rows)
+        memory_mb = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+
+        # what users type: the first 1-4 characters of existing tags
+        prefixes = [name[:rng.randint(1, 4)] for name in rng.choices(names, k=queries)]
+
+        def sql(prefix):
+            return list(
+                Tag.objects.filter(name__istartswith=prefix)
+                .order_by('-questions_count', 'name')
+                .values_list('name', 'questions_count')[:limit]
+            )
+
+        for prefix in prefixes[:20]:
+            if index.suggest(prefix, limit) != sql(prefix):
+                self.stderr.write(self.style.WARNING(f'results differ for {prefix!r}'))
+
+        self.stdout.write(f'{len(names)} tags, {queries} prefixes, top {limit}')
+        self.stdout.write(f'index: built from the db in {build_ms:.0f} ms, {memory_mb:.1f} MB')
+        for label, suggest in [('index', lambda prefix: index.suggest(prefix, limit)), ('sql', sql)]:
+            by_length = {}
+            for prefix in prefixes:
+                started = time.perf_counter()
+                suggest(prefix)
+                by_length.setdefault(len(prefix), []).append((time.perf_counter() - started) * 1_000_000)
+            timings = [timing for samples in by_length.values() for timing in samples]
+            self.stdout.write(
+                f'{label:>5}: p50 {percentile(timings, 50):.0f} us  p95 {percentile(timings, 95):.0f} us  '
+                + '  '.join(
+                    f'len {length}: p50 {percentile(samples, 50):.0f} us'
+                    for length, samples in sorted(by_length.items())
+                )
+            )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from app.avatars import update_thumbnails
+from app.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized avatar variants of profiles uploaded before thumbnails existed'
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='also regenerate profiles that already have variants (e.g. after a pipeline change)')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+
+    def handle(self, *args, **kwargs):
+        profiles = Profile.objects.exclude(avatar_image='').exclude(avatar_image=None).order_by('pk')
+        if not kwargs['all']:
+            profiles = profiles.filter(avatar_thumbnail='')
+
+        done = failed = 0
+        for profile in profiles.only('pk', 'avatar_image', 'avatar_thumbnail').iterator(chunk_size=kwargs['batch_size']):
+            if kwargs['all']:
+                profile.avatar_thumbnail = ''
+            try:
+                name = update_thumbnails(profile)
+            except OSError as e:
+                # missing source file
+                self.stderr.write(f'{profile.pk}: {e}')
+                name = ''
+            if name:
+                done += 1
+            else:
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Resized {done} avatars, {failed} could not be read'))
@@ -0,0 +1,66 @@
+import copy
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from app.dbpool import pool_stats
+from app.management.commands.bench import percentile
+
+BENCH_QUERY = 'SELECT 1'
+
+
+class Command(BaseCommand):
+    help = ("Show this process's database connection pool statistics, or with --bench "
+            "measure the per-request connection cost with and without the pool")
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--bench', type=int, metavar='N', default=0,
+                            help='open, query and close a connection N times in each mode')
+
+
+    def handle(self, *args, **kwargs):
+        connection = connections[kwargs['database']]
+        if getattr(connection, 'pool', None) is None:
+            raise CommandError(f'{connection.alias} is not pooled, set OPTIONS["pool"] (PostgreSQL with psycopg 3)')
+
+        if kwargs['bench']:
+            self.bench(connection, kwargs['bench'])
+
+        for name, value in sorted(pool_stats()[connection.alias].items()):
+            self.stdout.write(f'{name:>20}: {value}')
+
+
+    def bench(self, connection, iterations):
+        # the same settings without the pool: a fresh connection per request
+        settings_dict = copy.deepcopy(connection.settings_dict)
+        settings_dict['OPTIONS'].pop('pool')
+        direct = connection.__class__(settings_dict, alias=f'{connection.alias}_unpooled')
+
+        p50 = {}
+        for label, wrapper in (('unpooled', direct), ('pooled', connection)):
+            timings = self.time_requests(wrapper, iterations)
+            p50[label] = percentile(timings, 50)
+            self.stdout.write(
+                f'{label:>9}: p50 {p50[label]:.3f} ms  '
+                f'p95 {percentile(timings, 95):.3f} ms  p99 {percentile(timings, 99):.3f} ms'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'saved per request (p50): {p50["unpooled"] - p50["pooled"]:.3f} ms'
+        ))
+
+
+    def time_requests(self, wrapper, iterations):
+        wrapper.close()
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            # what a request does: connect on its first query, close when it's finished
+            with wrapper.cursor() as cursor:
+                cursor.execute(BENCH_QUERY)
+                cursor.fetchone()
+            wrapper.close()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
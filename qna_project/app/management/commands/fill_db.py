@@ -1,10 +1,14 @@
+from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
 
 from app.models import Question, Answer, Tag, Profile, QuestionVote, AnswerVote
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections, transaction
 from faker import Faker
 from rich.progress import Progress
 
+import multiprocessing
 import random
 
 DEFAULT_NUM = 100
@@ -12,122 +16,353 @@ QUESTION_RATIO = 10
 ANSWER_RATIO = 100
 VOTE_RATIO = 200
 
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_PASSWORD = 'password'
+
+# size of the pre-generated pools of fake text; Faker is far too slow to call per row
+TEXT_POOL_SIZE = 1000
+
+# id and text pools of the current run, set before worker processes are forked so they inherit them
+POOLS = {}
+
+
+def insert_rows(model, objs, use_copy=False):
+    """Insert model instances with a single multi-row INSERT, or COPY on PostgreSQL."""
+    if not use_copy:
+        model.objects.bulk_create(objs)
+        return
+
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    columns = ', '.join(connection.ops.quote_name(f.column) for f in fields)
+    table = connection.ops.quote_name(model._meta.db_table)
+
+    with connection.cursor() as cursor:
+        with cursor.cursor.copy(f'COPY {table} ({columns}) FROM STDIN') as copy:
+            for obj in objs:
+                copy.write_row([
+                    f.get_db_prep_save(f.pre_save(obj, add=True), connection)
+                    for f in fields
+                ])
+
+
+def fill_text_pools(fake):
+    """Generated once per run, every chunk draws from the same pools."""
+    POOLS['sentences'] = [fake.sentence()[:-1] for _ in range(TEXT_POOL_SIZE)]
+    POOLS['paragraphs'] = [fake.paragraph() for _ in range(TEXT_POOL_SIZE)]
+
+
+class Generator:
+    """Builds model instances from a seeded RNG and the pools of fake text."""
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+
+    def title(self):
+        return self.random.choice(POOLS['sentences']) + '?'
+
+    def paragraph(self):
+        return self.random.choice(POOLS['paragraphs'])
+
+    def vote_value(self):
+        return self.random.choice([-1, 1])
+
+
+def generate_chunk(task):
+    """
+    Worker entry point: inserts one chunk of one kind of rows.
+    Every chunk has its own seed, so the result does not depend on the number of workers.
+    """
+    kind, chunk, start, count, seed, batch_size, use_copy = task
+    gen = Generator(seed * 1_000_003 + chunk)
+    builders = {
+        'questions': build_questions,
+        'question_tags': build_question_tags,
+        'answers': build_answers,
+        'question_votes': build_question_votes,
+        'answer_votes': build_answer_votes,
+    }
+
+    rows = 0
+    for batch in builders[kind](gen, start, count, batch_size):
+        with transaction.atomic():
+            insert_rows(batch[0].__class__, batch, use_copy)
+        rows += len(batch)
+
+    if multiprocessing.parent_process() is not None:
+        connection.close()
+    return rows
+
+
+def close_connections():
+    """
+    Closes every connection before forking: children must not share the parent's sockets.
+    With DB_POOL close() only hands a connection back to the pool, so the pools go too;
+    the parent opens a new one on its next query, every child its own.
+    """
+    for conn in connections.all():
+        conn.close()
+        if hasattr(conn, 'close_pool'):
+            conn.close_pool()
+
+
+def batched(objs, batch_size):
+    batch = []
+    for obj in objs:
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_questions(gen, start, count, batch_size):
+    profiles = POOLS['profiles']
+    return batched((
+        Question(title=gen.title(), text=gen.paragraph(), profile_id=gen.random.choice(profiles))
+        for _ in range(count)
+    ), batch_size)
+
+
+def build_question_tags(gen, start, count, batch_size):
+    questions, tags = POOLS['questions'], POOLS['tags']
+    Through = Question.tags.through
+
+    def rows():
+        for question_id in questions[start:start + count]:
+            for tag_id in gen.random.sample(tags, min(len(tags), gen.random.randint(1, 5))):
+                yield Through(question_id=question_id, tag_id=tag_id)
+    return batched(rows(), batch_size)
+
+
+def build_answers(gen, start, count, batch_size):
+    profiles, questions = POOLS['profiles'], POOLS['questions']
+    return batched((
+        Answer(text=gen.paragraph(), profile_id=gen.random.choice(profiles), question_id=gen.random.choice(questions))
+        for _ in range(count)
+    ), batch_size)
+
+
+def unique_pairs(gen, targets, start, count):
+    """
+    `count` distinct (target, profile) pairs out of the slice [start, start + pair_span)
+    of the pair space assigned to this chunk, so that chunks never collide either.
+    """
+    profiles = POOLS['profiles']
+    span = POOLS['pair_span']
+    for code in gen.random.sample(range(start, start + span), count):
+        yield targets[code // len(profiles)], profiles[code % len(profiles)]
+
+
+def build_question_votes(gen, start, count, batch_size):
+    return batched((
+        QuestionVote(question_id=question_id, profile_id=profile_id, value=gen.vote_value())
+        for question_id, profile_id in unique_pairs(gen, POOLS['questions'], start, count)
+    ), batch_size)
+
+
+def build_answer_votes(gen, start, count, batch_size):
+    return batched((
+        AnswerVote(answer_id=answer_id, profile_id=profile_id, value=gen.vote_value())
+        for answer_id, profile_id in unique_pairs(gen, POOLS['answers'], start, count)
+    ), batch_size)
+
+
 class Command(BaseCommand):
     help = 'Fill database with fake data'
-    
-    fake = Faker()
 
-    
+
     def add_arguments(self, parser):
-        parser.add_argument("ratio", type=int, default=100)
+        parser.add_argument("ratio", type=int, default=DEFAULT_NUM)
+        parser.add_argument('--seed', type=int, default=0, help='same seed, same dataset')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=1, help='insert chunks from N processes (PostgreSQL)')
+        parser.add_argument('--copy', action='store_true', help='load with COPY instead of INSERT (PostgreSQL)')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help="don't recompute counters, hot scores and the search index afterwards")
 
 
     def handle(self, *args, **kwargs):
         ratio = int(kwargs["ratio"])
-        self.stdout.write(f'Filling the database (ratio = {ratio})')
+        self.seed = kwargs['seed']
+        self.batch_size = kwargs['batch_size']
+        self.workers = kwargs['workers']
+        self.use_copy = kwargs['copy']
+
+        if (self.use_copy or self.workers > 1) and connection.vendor != 'postgresql':
+            raise CommandError('--copy and --workers need PostgreSQL')
+
+        self.stdout.write(f'Filling the database (ratio = {ratio}, seed = {self.seed})')
+        self.fake = Faker()
+        self.fake.seed_instance(self.seed)
+        fill_text_pools(self.fake)
+        self.gen = Generator(self.seed)
 
         self.generate_fake_profiles(ratio)
         self.generate_fake_tags(ratio)
         self.generate_fake_questions(ratio * QUESTION_RATIO)
         self.generate_fake_answers(ratio * ANSWER_RATIO)
         self.generate_fake_votes(ratio * VOTE_RATIO)
-                
-                
+
+        if not kwargs['skip_derived']:
+            # bulk inserts bypass the signals that keep these up to date
+            call_command('sync_counters', stdout=self.stdout)
+            call_command('rebuild_hot_scores', stdout=self.stdout)
+            call_command('rebuild_search_index', stdout=self.stdout)
+
+
+    def run_chunks(self, kind, total):
+        """Split `total` rows of `kind` into batch-sized chunks and insert them; returns the rows inserted."""
+        return self.run_tasks(kind, total, [
+            (kind, i, start, min(self.batch_size, total - start), self.seed, self.batch_size, self.use_copy)
+            for i, start in enumerate(range(0, total, self.batch_size))
+        ])
+
+
+    def run_tasks(self, kind, total, tasks):
+        inserted = 0
+        with Progress() as p:
+            t = p.add_task(kind, total=total)
+            if self.workers > 1:
+                close_connections()
+                with multiprocessing.get_context('fork').Pool(self.workers) as pool:
+                    for rows in pool.imap_unordered(generate_chunk, tasks):
+                        p.update(t, advance=rows)
+                        inserted += rows
+            else:
+                for task in tasks:
+                    rows = generate_chunk(task)
+                    p.update(t, advance=rows)
+                    inserted += rows
+        return inserted
+
+
+    def new_ids(self, model, after):
+        return list(model.objects.filter(pk__gt=after).order_by('pk').values_list('pk', flat=True))
+
+
+    def last_id(self, model):
+        return model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
     def generate_fake_profiles(self, num_profiles=100):
         self.stdout.write(f'Generating {num_profiles} profiles...')
-        
+
         User = get_user_model()
+        # hashing is deliberately slow, every fake user gets the same hash
+        password = make_password(DEFAULT_PASSWORD)
+        taken = set(User.objects.values_list('username', flat=True))
+        fake = self.fake
+
+        usernames = []
+        while len(usernames) < num_profiles:
+            username = fake.user_name()
+            if username in taken:
+                username = f'{username}{len(usernames)}'
+            if username not in taken:
+                taken.add(username)
+                usernames.append(username)
+
+        last_user = self.last_id(User)
         with Progress() as p:
-            t = p.add_task("", total=num_profiles)
-            while not p.finished:
-                p.update(t, advance=1)
-                user = User.objects.create_user(
-                    username=self.fake.user_name(),
-                    email=self.fake.email(),
-                    password=self.fake.password(),
-                    first_name=self.fake.first_name(),
-                    last_name=self.fake.last_name(),
-                )
-                Profile.objects.create(
-                    user=user,
-                    nickname=user.username,
-                    avatar_url=f"../static/img/avatar_placeholders/{random.randint(0, 6)}.svg",
-                )
-        
+            t = p.add_task("users", total=num_profiles * 2)
+            for batch in batched((
+                User(
+                    username=username,
+                    email=fake.email(),
+                    password=password,
+                    first_name=fake.first_name(),
+                    last_name=fake.last_name(),
+                ) for username in usernames
+            ), self.batch_size):
+                insert_rows(User, batch, self.use_copy)
+                p.update(t, advance=len(batch))
+
+            users = User.objects.filter(pk__gt=last_user).order_by('pk').values_list('pk', 'username')
+            for batch in batched((
+                Profile(
+                    user_id=user_id,
+                    nickname=username[:32],
+                    avatar_url=f"../static/img/avatar_placeholders/{self.gen.random.randint(0, 6)}.svg",
+                ) for user_id, username in users
+            ), self.batch_size):
+                insert_rows(Profile, batch, self.use_copy)
+                p.update(t, advance=len(batch))
+
+        POOLS['profiles'] = list(Profile.objects.order_by('pk').values_list('pk', flat=True))
         self.stdout.write(self.style.SUCCESS(f'Successfully created {num_profiles} users'))
-        
-        
-    def generate_fake_questions(self, num_questions=100):
-        self.stdout.write(f'Generating {num_questions} questions...')
-        
-        with Progress() as p:
-            t = p.add_task("", total=num_questions)
-            while not p.finished:
-                p.update(t, advance=1)
-                profile = Profile.objects.order_by('?').first()
-                question = Question.objects.create(
-                    title=self.fake.sentence()[:-1] + '?',
-                    text=self.fake.paragraph(),
-                    profile=profile,
-                ) 
-                
-                for _ in range(self.fake.random_int(min=1, max=5)):
-                    tag = Tag.objects.order_by('?').first()
-                    question.tags.add(tag)
-                
-        self.stdout.write(self.style.SUCCESS(f'Successfully created {num_questions} questions'))
-        
-        
+
+
     def generate_fake_tags(self, num_tags=100):
         self.stdout.write(f'Generating {num_tags} tags...')
-        
-        with Progress() as p:
-            t = p.add_task("", total=num_tags)
-            while not p.finished:
-                p.update(t, advance=1)
-                Tag.objects.create(name=self.fake.word())
-            
+
+        taken = set(Tag.objects.values_list('name', flat=True))
+        names = []
+        while len(names) < num_tags:
+            name = self.fake.word()
+            if name in taken:
+                name = f'{name}{len(names)}'
+            if name not in taken:
+                taken.add(name)
+                names.append(name)
+
+        for batch in batched((Tag(name=name) for name in names), self.batch_size):
+            insert_rows(Tag, batch, self.use_copy)
+
+        POOLS['tags'] = list(Tag.objects.order_by('pk').values_list('pk', flat=True))
         self.stdout.write(self.style.SUCCESS(f'Successfully created {num_tags} tags'))
-        
-        
+
+
+    def generate_fake_questions(self, num_questions=100):
+        self.stdout.write(f'Generating {num_questions} questions...')
+
+        last_question = self.last_id(Question)
+        created = self.run_chunks('questions', num_questions)
+        POOLS['questions'] = self.new_ids(Question, last_question)
+        self.run_chunks('question_tags', len(POOLS['questions']))
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully created {created} questions'))
+
+
     def generate_fake_answers(self, num_answers=100):
         self.stdout.write(f'Generating {num_answers} answers...')
-        
-        with Progress() as p:
-            t = p.add_task("", total=num_answers)
-            while not p.finished:
-                p.update(t, advance=1)
-                profile = Profile.objects.order_by('?').first()
-                question = Question.objects.order_by('?').first()
-                answer = Answer.objects.create(
-                    text=self.fake.paragraph(),
-                    profile=profile,
-                    question=question,
-                )
-            
-        self.stdout.write(self.style.SUCCESS(f'Successfully created {num_answers} answers'))
-        
-        
+
+        last_answer = self.last_id(Answer)
+        created = self.run_chunks('answers', num_answers)
+        POOLS['answers'] = self.new_ids(Answer, last_answer)
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully created {created} answers'))
+
+
     def generate_fake_votes(self, num_votes=100):
         self.stdout.write(f'Generating {num_votes} votes...')
-        
-        with Progress() as p:
-            t = p.add_task("", total=num_votes)
-            while not p.finished:
-                p.update(t, advance=2)
-                profile = Profile.objects.order_by('?').first()
-                question = Question.objects.order_by('?').first()
-                answer = Answer.objects.order_by('?').first()
-                vote = QuestionVote.objects.create(
-                    question=question,
-                    profile=profile,
-                    value=random.choice([-1, 1]),
-                )
-                vote = AnswerVote.objects.create(
-                    answer=answer,
-                    profile=profile,
-                    value=random.choice([-1, 1]),
-                )
-            
-        self.stdout.write(self.style.SUCCESS(f'Successfully created {num_votes} votes'))
-            
\ No newline at end of file
+
+        # half on questions, half on answers; votes only target rows created by this run,
+        # so (target, profile) pairs can't clash with votes already in the database
+        created = (
+            self.run_vote_chunks('question_votes', POOLS['questions'], num_votes // 2)
+            + self.run_vote_chunks('answer_votes', POOLS['answers'], num_votes - num_votes // 2)
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully created {created} votes'))
+
+
+    def run_vote_chunks(self, kind, targets, num_votes):
+        space = len(targets) * len(POOLS['profiles'])
+        if num_votes > space:
+            self.stdout.write(self.style.WARNING(
+                f'Only {space} distinct {kind.replace("_", " ")} are possible, capping'
+            ))
+            num_votes = space
+        if not num_votes:
+            return 0
+
+        # chunk i draws its pairs from its own slice of the pair space
+        chunks = max(1, min(num_votes // self.batch_size, space // (2 * self.batch_size)))
+        POOLS['pair_span'] = space // chunks
+        per_chunk = -(-num_votes // chunks)
+        tasks = []
+        for i in range(chunks):
+            count = min(per_chunk, num_votes - i * per_chunk, POOLS['pair_span'])
+            tasks.append((kind, i, i * POOLS['pair_span'], count, self.seed, self.batch_size, self.use_copy))
+
+        return self.run_tasks(kind, num_votes, tasks)
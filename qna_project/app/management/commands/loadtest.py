@@ -0,0 +1,151 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.management.commands.bench import percentile
+
+DEFAULT_CONCURRENCY = 200
+DEFAULT_REQUESTS = 5000
+
+
+class HttpClient:
+    """Minimal HTTP/1.1 keep-alive client, enough to load test our own pages."""
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\nConnection: keep-alive\r\n\r\n'.encode()
+        )
+        await self.writer.drain()
+        return await asyncio.wait_for(self.read_response(), self.timeout)
+
+    async def read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by the server')
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+        else:
+            await self.reader.readexactly(int(headers.get('content-length', 0)))
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    help = ('Load test a running server (e.g. the WSGI and the ASGI deployment) with concurrent '
+            'keep-alive clients and report throughput and latency percentiles')
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='base URL of the server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--paths', default='/,/hot/', help='comma separated paths, requested round-robin')
+        parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+        parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS)
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--bust-cache', action='store_true',
+                            help='add a unique query string to every request so that the page cache always misses')
+        parser.add_argument('--json', action='store_true', help='print the report as JSON')
+
+
+    def handle(self, *args, **kwargs):
+        url = urlsplit(kwargs['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('only plain http:// URLs are supported')
+
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.prefix = url.path.rstrip('/')
+        self.paths = [path for path in kwargs['paths'].split(',') if path]
+        self.total = kwargs['requests']
+        self.timeout = kwargs['timeout']
+        self.bust_cache = kwargs['bust_cache']
+
+        report = asyncio.run(self.run(kwargs['concurrency']))
+
+        if kwargs['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(
+            f'{report["requests"]} requests, {report["concurrency"]} clients, {report["seconds"]} s\n'
+            f'throughput: {report["rps"]} req/s\n'
+            f'latency ms: p50 {report["p50_ms"]}  p95 {report["p95_ms"]}  p99 {report["p99_ms"]}  max {report["max_ms"]}\n'
+            f'statuses: {report["statuses"]}  errors: {report["errors"]}'
+        )
+
+
+    async def run(self, concurrency):
+        self.next_request = 0
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(self.client() for _ in range(concurrency)))
+        seconds = time.perf_counter() - started
+
+        latencies = self.latencies or [0]
+        return {
+            'requests': len(self.latencies),
+            'concurrency': concurrency,
+            'seconds': round(seconds, 2),
+            'rps': round(len(self.latencies) / seconds, 1),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+            'max_ms': round(max(latencies), 1),
+            'statuses': dict(self.statuses),
+            'errors': dict(self.errors),
+        }
+
+
+    async def client(self):
+        http = HttpClient(self.host, self.port, self.timeout)
+        try:
+            while self.next_request < self.total:
+                path = self.prefix + self.paths[self.next_request % len(self.paths)]
+                if self.bust_cache:
+                    path += ('&' if '?' in path else '?') + f'nocache={self.next_request}'
+                self.next_request += 1
+
+                started = time.perf_counter()
+                try:
+                    status = await http.get(path)
+                except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                    self.errors[type(e).__name__] += 1
+                    await http.close()
+                    continue
+                self.latencies.append((time.perf_counter() - started) * 1000)
+                self.statuses[status] += 1
+        finally:
+            await http.close()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from app.ranking import rebuild_hot_scores
+from app.surrogates import purge
+
+
+class Command(BaseCommand):
+    help = 'Recompute Question.hot_score, e.g. after bulk inserts; scores never decay, so no need to schedule it'
+    
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        
+        
+    def handle(self, *args, **kwargs):
+        updated = rebuild_hot_scores(batch_size=kwargs['batch_size'])
+        purge('feed:hot')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the hot score of {updated} questions'))
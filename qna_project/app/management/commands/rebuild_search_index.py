@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app.search import rebuild_index, full_text_supported
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the question search index (tsvector on PostgreSQL, inverted index elsewhere)'
+    
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        
+        
+    def handle(self, *args, **kwargs):
+        backend = 'full-text' if full_text_supported() else 'inverted index'
+        self.stdout.write(f'Rebuilding {backend} search data...')
+        
+        count = rebuild_index(batch_size=kwargs['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} questions'))
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from app.models import Question, Answer, Tag, Profile, ProfileStats, QuestionVote, AnswerVote
+
+
+def subquery_total(queryset, fk, aggregate):
+    """Per-row aggregate over `queryset` grouped by `fk`, usable inside an UPDATE."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{fk: OuterRef('pk')})
+            .order_by()
+            .values(fk)
+            .annotate(total=aggregate)
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Re-derive denormalized ratings, answer, tag and profile counters from the tables they summarize'
+    
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='only report drifted rows')
+        
+        
+    def counters(self):
+        return [
+            (Question, 'rating', subquery_total(QuestionVote.objects, 'question', Sum('value'))),
+            (Question, 'answers_count', subquery_total(Answer.objects, 'question', Count('id'))),
+            (Answer, 'rating', subquery_total(AnswerVote.objects, 'answer', Sum('value'))),
+            (Tag, 'questions_count', subquery_total(Question.tags.through.objects, 'tag', Count('id'))),
+            (ProfileStats, 'question_count', subquery_total(Question.objects, 'profile', Count('id'))),
+            (ProfileStats, 'answer_count', subquery_total(Answer.objects, 'profile', Count('id'))),
+            (ProfileStats, 'accepted_answer_count',
+             subquery_total(Answer.objects.filter(is_correct=True), 'profile', Count('id'))),
+            (ProfileStats, 'rating_received',
+             subquery_total(Question.objects, 'profile', Sum('rating'))
+             + subquery_total(Answer.objects, 'profile', Sum('rating'))),
+        ]
+        
+        
+    def handle(self, *args, **kwargs):
+        dry_run = kwargs['dry_run']
+        
+        with transaction.atomic():
+            # bulk inserted profiles (fill_db) come without a stats row
+            missing = Profile.objects.filter(stats__isnull=True).order_by()
+            if dry_run:
+                created = missing.count()
+            else:
+                created = len(ProfileStats.objects.bulk_create(
+                    ProfileStats(profile_id=pk) for pk in missing.values_list('pk', flat=True)
+                ))
+            self.stdout.write(f'ProfileStats: {created} row(s) {"missing" if dry_run else "created"}')
+            
+            for model, field, actual in self.counters():
+                drifted = model.objects.order_by().annotate(actual=actual).exclude(**{field: F('actual')})
+                if dry_run:
+                    fixed = drifted.count()
+                else:
+                    fixed = model.objects.filter(pk__in=drifted.values('pk')).update(**{field: actual})
+                
+                label = f'{model.__name__}.{field}'
+                self.stdout.write(f'{label}: {fixed} row(s) {"drifted" if dry_run else "repaired"}')
+                
+        self.stdout.write(self.style.SUCCESS('Counters are in sync' if not dry_run else 'Dry run finished'))
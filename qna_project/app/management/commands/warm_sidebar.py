@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.sidebar import refresh_sidebar
+
+
+class Command(BaseCommand):
+    help = 'Recompute the cached sidebar (popular tags, best members) out of band'
+    
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='keep refreshing every N seconds instead of running once')
+        
+        
+    def handle(self, *args, **kwargs):
+        interval = kwargs['interval']
+        
+        while True:
+            data = refresh_sidebar()
+            self.stdout.write(self.style.SUCCESS(
+                f'Sidebar refreshed: {len(data["tags"])} tags, {len(data["profiles"])} profiles'
+            ))
+            if not interval:
+                break
+            time.sleep(interval)
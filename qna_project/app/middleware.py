@@ -0,0 +1,252 @@
+import hashlib
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_etags, parse_http_date_safe
+
+from .profiling import RequestProfile, current_profile, install_query_hook, install_template_timer
+from .staticfiles import accepted_encodings, collected_assets
+from .surrogates import key_versions
+
+logger = logging.getLogger('app.profiling')
+
+PAGE_PREFIX = 'page:'
+
+
+class StaticAssetMiddleware:
+    """
+    Serves the output of collectstatic (see app.staticfiles) straight from STATIC_ROOT,
+    picking the precompressed variant the client accepts and answering
+    If-None-Match with 304. The file list is read once per process, so
+    collectstatic has to run before the server starts; without it the
+    middleware disables itself.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.assets = collected_assets()
+        if not self.assets:
+            raise MiddlewareNotUsed('no collected static files')
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.serve(request, streaming=True)
+        return self.get_response(request) if response is None else response
+
+    async def __acall__(self, request):
+        # ASGI can't stream a file iterator without a thread per chunk, and the files are small
+        response = self.serve(request, streaming=False)
+        return await self.get_response(request) if response is None else response
+
+    def serve(self, request, streaming):
+        asset = self.assets.get(request.path_info) if request.method in ('GET', 'HEAD') else None
+        if asset is None:
+            return None
+
+        encoding, (path, size, etag) = asset.variant(accepted_encodings(request.headers.get('Accept-Encoding', '')))
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=asset.content_type)
+            elif streaming:
+                response = FileResponse(open(path, 'rb'), content_type=asset.content_type)
+                # it would name the .gz file
+                del response['Content-Disposition']
+            else:
+                with open(path, 'rb') as f:
+                    response = HttpResponse(f.read(), content_type=asset.content_type)
+            response['Content-Length'] = size
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Cache-Control'] = asset.cache_control
+        response['ETag'] = etag
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
+
+class AnonymousPageCacheMiddleware:
+    """
+    Full-page cache for anonymous GET requests.
+
+    Views opt in by tagging the request with surrogate keys (see app.surrogates);
+    a cached page is served only while all of its keys still have the versions
+    they had when it was stored. Requests without a session cookie are known to
+    be anonymous without loading the session, so a hit never touches the database.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_cacheable_request(request):
+            return self.get_response(request)
+
+        response = self.cached_response(request)
+        if response is not None:
+            return response
+
+        started = time.time_ns()
+        response = self.get_response(request)
+        return self.store(request, response, started)
+
+    async def __acall__(self, request):
+        if not self.is_cacheable_request(request):
+            return await self.get_response(request)
+
+        # cache backends are synchronous, keep them off the event loop
+        response = await sync_to_async(self.cached_response, thread_sensitive=False)(request)
+        if response is not None:
+            return response
+
+        started = time.time_ns()
+        response = await self.get_response(request)
+        return await sync_to_async(self.store, thread_sensitive=False)(request, response, started)
+
+    def cached_response(self, request):
+        entry = cache.get(self.page_key(request))
+        if entry is not None and key_versions(list(entry['keys'])) == entry['keys']:
+            response = self.build_response(entry)
+            # the stored validators (app.conditional) still describe this page
+            return get_conditional_response(
+                request,
+                etag=response.get('ETag'),
+                last_modified=parse_http_date_safe(response.get('Last-Modified')),
+                response=response,
+            )
+        return None
+
+    def store(self, request, response, started):
+        keys = getattr(request, 'surrogate_keys', None)
+        if not keys or not self.is_cacheable_response(response):
+            return response
+
+        response['Surrogate-Key'] = ' '.join(sorted(keys))
+        response['X-Page-Cache'] = 'miss'
+
+        # a page rendered while one of its keys was being purged may already be stale;
+        # app.conditional has checked that already if the view is a conditional_page
+        versions = getattr(request, 'surrogate_versions', None) or key_versions(sorted(keys), purged_after=started)
+        if versions is not None:
+            cache.set(self.page_key(request), {
+                'content': response.content,
+                'status': response.status_code,
+                'headers': list(response.items()),
+                'keys': versions,
+            }, settings.PAGE_CACHE_TTL)
+        return response
+
+    def is_cacheable_request(self, request):
+        return (
+            request.method in ('GET', 'HEAD')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        )
+
+    def is_cacheable_response(self, response):
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and 'private' not in response.get('Cache-Control', '')
+        )
+
+    def page_key(self, request):
+        # the WSGI and the ASGI URLconf render different pages (live updates)
+        url = settings.ROOT_URLCONF + ' ' + request.build_absolute_uri()
+        return PAGE_PREFIX + hashlib.md5(url.encode()).hexdigest()
+
+    def build_response(self, entry):
+        response = HttpResponse(entry['content'], status=entry['status'])
+        for header, value in entry['headers']:
+            response[header] = value
+        response['X-Page-Cache'] = 'hit'
+        return response
+
+
+class RequestProfilingMiddleware:
+    """
+    Measures query count, SQL time, template render time and the slowest
+    statements of a sampled fraction of requests (REQUEST_PROFILING_SAMPLE_RATE).
+
+    The numbers go to a Server-Timing header and to one JSON log line per request;
+    query shapes repeated REQUEST_PROFILING_REPEAT_THRESHOLD times or more are
+    logged as likely N+1 patterns. Requests that aren't sampled pay for one
+    random() call, and every query for one ContextVar lookup.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        install_query_hook()
+        install_template_timer()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.REQUEST_PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        profile = RequestProfile(slowest=settings.REQUEST_PROFILING_SLOWEST)
+        token = current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.REQUEST_PROFILING_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        profile = RequestProfile(slowest=settings.REQUEST_PROFILING_SLOWEST)
+        token = current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.finish(request, response, profile)
+
+    def finish(self, request, response, profile):
+        profile.finish()
+        response['Server-Timing'] = profile.server_timing()
+        self.log(request, response, profile)
+        return response
+
+    def log(self, request, response, profile):
+        threshold = settings.REQUEST_PROFILING_REPEAT_THRESHOLD
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **profile.as_dict(threshold),
+        }
+        logger.info(json.dumps(record))
+        for repeated in record['repeated']:
+            logger.warning(json.dumps({
+                'event': 'n_plus_one',
+                'method': request.method,
+                'path': request.path,
+                **repeated,
+            }))
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:39
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def subquery_total(queryset, fk, aggregate):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(total=aggregate).values('total'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Question = apps.get_model('app', 'Question')
+    Answer = apps.get_model('app', 'Answer')
+    QuestionVote = apps.get_model('app', 'QuestionVote')
+    AnswerVote = apps.get_model('app', 'AnswerVote')
+    
+    Question.objects.update(
+        rating=subquery_total(QuestionVote.objects, 'question', Sum('value')),
+        answers_count=subquery_total(Answer.objects, 'question', Count('id')),
+    )
+    Answer.objects.update(rating=subquery_total(AnswerVote.objects, 'answer', Sum('value')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_profile_avatar_image_profile_avatar_url_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='rating',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='answers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='rating',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='answervote',
+            unique_together={('answer', 'profile')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='questionvote',
+            unique_together={('question', 'profile')},
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:41
+
+import datetime
+import math
+
+from django.db import migrations, models
+
+# app.ranking.hot_score() as of this migration, later changes to it must not change history
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+ANSWER_WEIGHT = 2
+TIMESCALE = 45000
+
+
+def hot_score(rating, answers_count, created_at):
+    points = rating + ANSWER_WEIGHT * answers_count
+    activity = math.copysign(math.log10(max(abs(points), 1)), points)
+    return activity + (created_at - EPOCH).total_seconds() / TIMESCALE
+
+
+def fill_hot_scores(apps, schema_editor):
+    Question = apps.get_model('app', 'Question')
+    
+    batch = []
+    for question in Question.objects.order_by('pk').only('rating', 'answers_count', 'created_at').iterator(chunk_size=1000):
+        # created_at is nullable, such rows count from the epoch
+        question.hot_score = hot_score(question.rating, question.answers_count, question.created_at or EPOCH)
+        batch.append(question)
+        if len(batch) >= 1000:
+            Question.objects.bulk_update(batch, ['hot_score'])
+            batch = []
+    if batch:
+        Question.objects.bulk_update(batch, ['hot_score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_question_rating_answers_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='hot_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-hot_score', '-id'], name='question_hot_idx'),
+        ),
+        migrations.RunPython(fill_hot_scores, migrations.RunPython.noop),
+    ]
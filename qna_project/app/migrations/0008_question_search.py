@@ -0,0 +1,94 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:42
+
+import re
+from collections import Counter
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# app.search as of this migration: tokenizer and weights of the inverted index fallback
+WORD_RE = re.compile(r'\w+')
+TITLE_WEIGHT, TEXT_WEIGHT, ANSWER_WEIGHT = 4, 2, 1
+MAX_TERM_LENGTH = 64
+
+
+def add_terms(weights, text, weight):
+    for word in WORD_RE.findall(text.lower()):
+        if 1 < len(word) <= MAX_TERM_LENGTH:
+            weights[word] += weight
+
+
+def fill_search_data(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        # what app.search.rebuild_index() writes, in one statement
+        schema_editor.execute(
+            "UPDATE app_question SET search_vector = "
+            "setweight(to_tsvector(%s::regconfig, COALESCE(title, '')), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, COALESCE(text, '')), 'B') || "
+            "setweight(to_tsvector(%s::regconfig, COALESCE("
+            "(SELECT string_agg(text, ' ') FROM app_answer WHERE question_id = app_question.id), '')), 'C')",
+            [settings.SEARCH_CONFIG] * 3,
+        )
+        return
+    
+    Question = apps.get_model('app', 'Question')
+    Answer = apps.get_model('app', 'Answer')
+    SearchTerm = apps.get_model('app', 'SearchTerm')
+    
+    answers = {}
+    for question_id, text in Answer.objects.order_by().values_list('question_id', 'text').iterator(chunk_size=1000):
+        answers.setdefault(question_id, []).append(text)
+    
+    batch = []
+    for question_id, title, text in Question.objects.order_by('pk').values_list('pk', 'title', 'text').iterator(chunk_size=1000):
+        weights = Counter()
+        add_terms(weights, title, TITLE_WEIGHT)
+        add_terms(weights, text, TEXT_WEIGHT)
+        for answer in answers.pop(question_id, ()):
+            add_terms(weights, answer, ANSWER_WEIGHT)
+        batch.extend(SearchTerm(term=term, question_id=question_id, weight=weight) for term, weight in weights.items())
+        if len(batch) >= 5000:
+            SearchTerm.objects.bulk_create(batch)
+            batch = []
+    SearchTerm.objects.bulk_create(batch)
+
+
+def create_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX question_search_vector_idx ON app_question USING gin (search_vector)')
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS question_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_question_hot_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='app.question')),
+            ],
+            options={
+                'unique_together': {('term', 'question')},
+            },
+        ),
+        migrations.RunPython(create_gin_index, drop_gin_index),
+        migrations.RunPython(fill_search_data, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_question_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:48
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    """Tag.name becomes unique: keep the oldest tag of every name and move the questions over."""
+    Tag = apps.get_model('app', 'Tag')
+    Through = apps.get_model('app', 'Question').tags.through
+    
+    duplicates = Tag.objects.values('name').annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1)
+    for duplicate in duplicates:
+        extra = Tag.objects.filter(name=duplicate['name']).exclude(id=duplicate['keep'])
+        tagged = set(Through.objects.filter(tag_id=duplicate['keep']).values_list('question_id', flat=True))
+        moved = set(Through.objects.filter(tag__in=extra).values_list('question_id', flat=True)) - tagged
+        Through.objects.bulk_create(Through(question_id=q, tag_id=duplicate['keep']) for q in moved)
+        Through.objects.filter(tag__in=extra).delete()
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_question_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+    ]
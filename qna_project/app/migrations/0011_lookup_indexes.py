@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_merge_duplicate_tags'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tag',
+            name='name',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='answervote',
+            index=models.Index(fields=['answer', 'value'], name='answervote_sum_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-created_at', '-id'], name='question_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='questionvote',
+            index=models.Index(fields=['question', 'value'], name='questionvote_sum_idx'),
+        ),
+    ]
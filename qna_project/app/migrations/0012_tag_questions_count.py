@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:02
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_questions_count(apps, schema_editor):
+    Tag = apps.get_model('app', 'Tag')
+    Question = apps.get_model('app', 'Question')
+    Through = Question.tags.through
+    
+    Tag.objects.update(questions_count=Coalesce(
+        Subquery(
+            Through.objects.filter(tag=OuterRef('pk')).order_by().values('tag').annotate(total=Count('id')).values('total'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='questions_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-questions_count', 'name'], name='tag_popular_idx'),
+        ),
+        migrations.RunPython(fill_questions_count, migrations.RunPython.noop),
+    ]
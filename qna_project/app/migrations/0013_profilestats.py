@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def subquery_total(queryset, fk, aggregate):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(total=aggregate).values('total'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def fill_profile_stats(apps, schema_editor):
+    Profile = apps.get_model('app', 'Profile')
+    ProfileStats = apps.get_model('app', 'ProfileStats')
+    Question = apps.get_model('app', 'Question')
+    Answer = apps.get_model('app', 'Answer')
+    
+    ProfileStats.objects.bulk_create(
+        (ProfileStats(profile_id=pk) for pk in Profile.objects.values_list('pk', flat=True)),
+        batch_size=1000,
+    )
+    ProfileStats.objects.update(
+        question_count=subquery_total(Question.objects, 'profile', Count('id')),
+        answer_count=subquery_total(Answer.objects, 'profile', Count('id')),
+        accepted_answer_count=subquery_total(Answer.objects.filter(is_correct=True), 'profile', Count('id')),
+        rating_received=(
+            subquery_total(Question.objects, 'profile', Sum('rating'))
+            + subquery_total(Answer.objects, 'profile', Sum('rating'))
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_tag_questions_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileStats',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='app.profile')),
+                ('question_count', models.PositiveIntegerField(default=0)),
+                ('answer_count', models.PositiveIntegerField(default=0)),
+                ('accepted_answer_count', models.PositiveIntegerField(default=0)),
+                ('rating_received', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['-question_count', 'profile'], name='profilestats_questions_idx'),
+                    models.Index(fields=['-answer_count', 'profile'], name='profilestats_answers_idx'),
+                    models.Index(fields=['-rating_received', 'profile'], name='profilestats_rating_idx'),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_profile_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_profilestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_thumbnail',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+def fill_is_correct(apps, schema_editor):
+    Answer = apps.get_model('app', 'Answer')
+    Answer.objects.filter(is_correct=None).update(is_correct=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_profile_avatar_thumbnail'),
+    ]
+
+    operations = [
+        # NULLs would sort first in a descending PostgreSQL index and break the cursor
+        migrations.RunPython(fill_is_correct, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='answer',
+            name='is_correct',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', '-is_correct', '-rating', 'id'], name='answer_thread_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_answer_thread_order'),
+    ]
+
+    # the auto-created through model can't declare indexes: (tag_id, question_id)
+    # lets the multi-tag subqueries of QuestionQuerySet.tagged() skip the table
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX question_tags_tag_idx ON app_question_tags (tag_id, question_id)',
+            'DROP INDEX question_tags_tag_idx',
+        ),
+    ]
@@ -1,46 +1,133 @@
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Sum, Value, Count
-from django.db.models.functions import Coalesce
+from django.db import models, transaction
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
+from django.contrib.postgres.search import SearchVectorField
 
+from .avatars import thumbnail_url
 
-class QuestionManager(models.Manager):
+
+class QuestionQuerySet(models.QuerySet):
+    def for_cards(self):
+        """
+        Everything layout/card.html touches, loaded up front:
+        author and its user (for the profile link) in the same query,
+        tags in one extra query for the whole page.
+        Ratings and answer counts are stored columns, so no annotations are needed.
+        """
+        return (
+            self
+            .select_related('profile__user')
+            .prefetch_related(models.Prefetch('tags', queryset=Tag.objects.only('id', 'name')))
+        )
+    
+    def tagged(self, include, exclude=()):
+        """
+        Questions carrying every tag id in `include` and none in `exclude`.
+        
+        Several tags are matched by one grouped subquery over the links
+        (tag_id IN (...) GROUP BY question_id HAVING COUNT(*) = n), not a join
+        per tag, so no row is duplicated and the plan doesn't grow with the
+        number of tags; both subqueries read question_tags_tag_idx only.
+        """
+        Through = Question.tags.through
+        queryset = self
+        if len(include) == 1:
+            # links are unique, a single join can't duplicate rows
+            queryset = queryset.filter(tags=include[0])
+        elif include:
+            queryset = queryset.filter(pk__in=(
+                Through.objects
+                .filter(tag_id__in=include)
+                .values('question_id')
+                .annotate(matched=models.Count('tag_id'))
+                .filter(matched=len(set(include)))
+                .values('question_id')
+            ))
+        if exclude:
+            queryset = queryset.exclude(pk__in=Through.objects.filter(tag_id__in=exclude).values('question_id'))
+        return queryset
+
+class QuestionManager(models.Manager.from_queryset(QuestionQuerySet)):
+    # every ordering ends with the pk so that it can be used as a pagination cursor
     def get_queryset(self):
-        return super().get_queryset().order_by('-created_at')
+        return super().get_queryset().order_by('-created_at', '-id')
     
     def recent(self):
-        return self.get_queryset().order_by('-created_at')
+        return self.get_queryset().order_by('-created_at', '-id')
     
     def by_tag(self, tag_name):
         return self.get_queryset().filter(tags__name=tag_name)
     
     def most_upvoted(self):
-        return (
-            self.get_queryset()
-            .annotate(
-                total_votes=Coalesce(
-                    Sum('votes__value'),
-                    Value(0)
-                )
-            )
-            .order_by('-total_votes', '-created_at')
-        )
+        # hot_score is precomputed (see app.ranking), this is a plain index scan
+        return self.get_queryset().order_by('-hot_score', '-id')
         
 class TagManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset().order_by('name')
     
     def most_popular(self):
-        return self.get_queryset().annotate(total_questions=Count('question')).order_by('-total_questions')
+        # top-N read of tag_popular_idx, questions_count is maintained by app.signals
+        return self.get_queryset().order_by('-questions_count', 'name')
+    
+class AnswerManager(models.Manager):
+    def for_thread(self, question_id):
+        """
+        Answers of one question, accepted ones first, then by rating; walks answer_thread_idx.
+        Authors and their users (for the profile link) come in the same query.
+        """
+        return (
+            self.get_queryset()
+            .filter(question_id=question_id)
+            .select_related('profile__user')
+            .order_by('-is_correct', '-rating', 'id')
+        )
     
 class ProfileManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset().order_by('user__username')
     
     def most_active(self):
-        return self.get_queryset().annotate(total_questions=Count('question')).order_by('-total_questions')
+        # top-N read of profilestats_questions_idx, the inner join drops profiles without questions
+        return (
+            self.get_queryset()
+            .filter(stats__question_count__gt=0)
+            .order_by('-stats__question_count', 'stats__profile_id')
+        )
+
+class AtomicSaveModel(models.Model):
+    """
+    Saves the row and everything its post_save handlers write
+    (the denormalized counters in app.signals) in one transaction.
+    """
+    class Meta:
+        abstract = True
+    
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+class CounterFieldsModel(models.Model):
+    """
+    Leaves the denormalized counters (COUNTER_FIELDS) out of saves of existing rows.
+    app.signals and app.votes change them with UPDATE ... SET x = x + n, so an
+    instance loaded before such an update would write its stale values back.
+    Naming a counter in update_fields still saves it.
+    """
+    COUNTER_FIELDS = ()
+    
+    class Meta:
+        abstract = True
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.PROTECT)
@@ -48,6 +135,8 @@ class Profile(models.Model):
     
     avatar_url = models.URLField(blank=True, null=True)
     avatar_image = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # content-hash name of the resized avatar_image variants, see app.avatars
+    avatar_thumbnail = models.CharField(max_length=64, blank=True, default='', editable=False)
     
     created_at = models.DateTimeField(null=True, auto_now_add=True)
     updated_at = models.DateTimeField(null=True, auto_now=True)
@@ -59,10 +148,20 @@ class Profile(models.Model):
         """
         Returns the final URL to use in templates.
         Priority:
-        1) local image if uploaded
-        2) external URL if provided
-        3) default placeholder
+        1) 64px variant of the uploaded image
+        2) local image if uploaded (not resized yet, or not an image)
+        3) external URL if provided
+        4) default placeholder
         """
+        return self.avatar_sized(64)
+    
+    @property
+    def avatar_2x(self):
+        return self.avatar_sized(128)
+    
+    def avatar_sized(self, size):
+        if self.avatar_thumbnail:
+            return thumbnail_url(self.avatar_thumbnail, size)
         if self.avatar_image:
             return self.avatar_image.url
         if self.avatar_url:
@@ -72,39 +171,90 @@ class Profile(models.Model):
     def __str__(self):
         return self.user.username
 
-class Tag(models.Model):
-    name = models.CharField(max_length=255)
+class ProfileStats(models.Model):
+    """
+    Denormalized per-profile counters for the sidebar and leaderboards,
+    maintained by app.signals and app.votes and repaired by `sync_counters`.
+    """
+    profile = models.OneToOneField(Profile, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+    
+    question_count = models.PositiveIntegerField(default=0)
+    answer_count = models.PositiveIntegerField(default=0)
+    accepted_answer_count = models.PositiveIntegerField(default=0)
+    # sum of the ratings of the profile's questions and answers
+    rating_received = models.IntegerField(default=0)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-question_count', 'profile'], name='profilestats_questions_idx'),
+            models.Index(fields=['-answer_count', 'profile'], name='profilestats_answers_idx'),
+            models.Index(fields=['-rating_received', 'profile'], name='profilestats_rating_idx'),
+        ]
+    
+    def __str__(self):
+        return f'{self.profile}: {self.question_count} questions, {self.answer_count} answers'
+
+class Tag(CounterFieldsModel):
+    name = models.CharField(max_length=255, unique=True)
+    
+    # denormalized counter, maintained by app.signals and repaired by `sync_counters`
+    questions_count = models.PositiveIntegerField(default=0)
+    
+    COUNTER_FIELDS = ('questions_count',)
     
     created_at = models.DateTimeField(null=True,auto_now_add=True)
     updated_at = models.DateTimeField(null=True, auto_now=True)
     
     objects = TagManager()
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['-questions_count', 'name'], name='tag_popular_idx'),
+        ]
+    
     def __str__(self):
         return self.name
     
-class Question(models.Model):
+class Question(CounterFieldsModel):
     title = models.CharField(max_length=255)
     text = models.TextField()
     profile = models.ForeignKey(Profile, on_delete=models.PROTECT)
     tags = models.ManyToManyField(Tag, blank=True)
     
+    # denormalized counters, maintained by app.signals and repaired by `sync_counters`
+    rating = models.IntegerField(default=0)
+    answers_count = models.PositiveIntegerField(default=0)
+    hot_score = models.FloatField(default=0)
+    
+    # bumped whenever anything shown on the question's card changes; part of the card cache key
+    version = models.PositiveIntegerField(default=1)
+    
+    # full-text index on PostgreSQL, maintained by app.search (GIN index is created in migration 0008)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    COUNTER_FIELDS = ('rating', 'answers_count', 'hot_score', 'version', 'search_vector')
+    
     created_at = models.DateTimeField(null=True, auto_now_add=True)
     updated_at = models.DateTimeField(null=True, auto_now=True)
     
     objects = QuestionManager()
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='question_recent_idx'),
+            models.Index(fields=['-hot_score', '-id'], name='question_hot_idx'),
+        ]
+    
     def vote_sum(self):
-        result = self.votes.aggregate(total=Sum('value'))['total']
-        return result or 0
+        return self.rating
     
     def answer_count(self):
-        return self.answers.count()
+        return self.answers_count
     
     def __str__(self):
         return self.title
     
-class QuestionVote(models.Model):
+class QuestionVote(AtomicSaveModel):
     question = models.ForeignKey(Question, related_name='votes', on_delete=models.CASCADE)
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
     value = models.SmallIntegerField(choices=[(1, 'Upvote'), (-1, 'Downvote')])
@@ -114,27 +264,42 @@ class QuestionVote(models.Model):
     
     class Meta:
         unique_together = ('question', 'profile')
+        indexes = [
+            # lets SUM(value) per question be answered from the index alone
+            models.Index(fields=['question', 'value'], name='questionvote_sum_idx'),
+        ]
     
     def __str__(self) -> str:
         return f"{'👍' if self.value == 1 else '👎'} {self.profile} → {self.question.title}"
      
-class Answer(models.Model):
+class Answer(AtomicSaveModel, CounterFieldsModel):
     question = models.ForeignKey(Question, related_name='answers', on_delete=models.CASCADE)
     text = models.TextField()
-    is_correct = models.BooleanField(default=False, null=True)
+    is_correct = models.BooleanField(default=False)
     profile = models.ForeignKey(Profile, on_delete=models.PROTECT)
     
+    # denormalized counter, maintained by app.signals and repaired by `sync_counters`
+    rating = models.IntegerField(default=0)
+    
+    COUNTER_FIELDS = ('rating',)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AnswerManager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['question', '-is_correct', '-rating', 'id'], name='answer_thread_idx'),
+        ]
+    
     def vote_sum(self):
-        result = self.votes.aggregate(total=Sum('value'))['total']
-        return result or 0
+        return self.rating
     
     def __str__(self):
         return self.text[:50] + '...'
     
-class AnswerVote(models.Model):
+class AnswerVote(AtomicSaveModel):
     answer = models.ForeignKey(Answer, related_name='votes', on_delete=models.CASCADE)
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
     value = models.SmallIntegerField(choices=[(1, 'Upvote'), (-1, 'Downvote')])
@@ -144,7 +309,25 @@ class AnswerVote(models.Model):
     
     class Meta:
         unique_together = ('answer', 'profile')
+        indexes = [
+            models.Index(fields=['answer', 'value'], name='answervote_sum_idx'),
+        ]
     
     def __str__(self) -> str:
         return f"{'👍' if self.value == 1 else '👎'} {self.profile} → {self.answer.text[:50]}..."
 
+
+class SearchTerm(models.Model):
+    """
+    Inverted index used for search on databases without full-text search (SQLite).
+    One row per (term, question), weight is the weighted term frequency.
+    """
+    term = models.CharField(max_length=64)
+    question = models.ForeignKey(Question, related_name='search_terms', on_delete=models.CASCADE)
+    weight = models.PositiveIntegerField(default=1)
+    
+    class Meta:
+        unique_together = ('term', 'question')
+    
+    def __str__(self):
+        return f'{self.term} → {self.question_id}'
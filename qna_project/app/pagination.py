@@ -0,0 +1,177 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+
+# above this many rows the 'estimate' count mode stops counting
+ESTIMATE_CAP = 1000
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds datetimes to milliseconds, a cursor needs them exact
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None, count_is_estimate=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.count_is_estimate = count_is_estimate
+
+        # filled in by views.paginate so that links keep the other GET params
+        self.next_query = ''
+        self.previous_query = ''
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over the queryset's own ordering.
+
+    The ordering must end with a unique column (normally the pk) and none of its
+    columns may be NULL. Each page is a single `WHERE (keys) < (cursor) LIMIT n+1`
+    query that walks an index, so deep pages cost as much as the first one.
+
+    count:
+        None        - don't count at all
+        'exact'     - SELECT COUNT(*)
+        'estimate'  - planner estimate on PostgreSQL, a count capped at ESTIMATE_CAP elsewhere
+    """
+    def __init__(self, queryset, per_page=10, count=None):
+        ordering = tuple(queryset.query.order_by)
+        if not ordering:
+            raise ValueError('CursorPaginator needs an ordered queryset')
+
+        self.queryset = queryset
+        self.ordering = ordering
+        self.fields = [key.lstrip('-') for key in ordering]
+        self.per_page = per_page
+        self.count_mode = count
+
+    def page(self, cursor=None):
+        if cursor:
+            direction, values = self.decode(cursor)
+        else:
+            direction, values = 'n', None
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward=direction == 'n'))
+        if direction == 'p':
+            queryset = queryset.order_by(*[self._reverse(key) for key in self.ordering])
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if direction == 'p':
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        count, count_is_estimate = self._count()
+
+        return CursorPage(
+            rows,
+            next_cursor=self.encode('n', rows[-1]) if has_next and rows else None,
+            previous_cursor=self.encode('p', rows[0]) if has_previous and rows else None,
+            count=count,
+            count_is_estimate=count_is_estimate,
+        )
+
+    def encode(self, direction, obj):
+        payload = json.dumps([direction, [getattr(obj, field) for field in self.fields]], cls=CursorEncoder)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (ValueError, TypeError, binascii.Error):
+            raise InvalidCursor(cursor)
+
+        if direction not in ('n', 'p') or not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+
+        try:
+            values = [self._to_python(field, value) for field, value in zip(self.fields, values)]
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+        # ordering columns are never NULL, and a NULL can't be compared with
+        if any(value is None for value in values):
+            raise InvalidCursor(cursor)
+        return direction, values
+
+    def _to_python(self, field, value):
+        try:
+            model_field = self.queryset.model._meta.get_field(field)
+        except FieldDoesNotExist:
+            # annotation, e.g. a search rank: JSON already has the right type
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise TypeError(f'{field}: {value!r}')
+            return value
+        return model_field.to_python(value)
+
+    def _reverse(self, key):
+        return key[1:] if key.startswith('-') else '-' + key
+
+    def _seek(self, values, forward):
+        """
+        Rows strictly after (or before) `values` in the queryset ordering:
+        (a > x) OR (a = x AND b > y) OR ...
+        The leading `a >= x` is redundant but lets the planner use a range scan.
+        """
+        lookups = []
+        for key in self.ordering:
+            descending = key.startswith('-')
+            lookups.append('lt' if descending == forward else 'gt')
+
+        condition = Q()
+        equal = {}
+        for field, value, lookup in zip(self.fields, values, lookups):
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+
+        leading = Q(**{f'{self.fields[0]}__{lookups[0]}e': values[0]})
+        return leading & condition
+
+    def _count(self):
+        if self.count_mode == 'exact':
+            return self.queryset.count(), False
+        if self.count_mode == 'estimate':
+            return self._estimate()
+        return None, False
+
+    def _estimate(self):
+        queryset = self.queryset.order_by()
+        if connections[queryset.db].vendor == 'postgresql':
+            plan = json.loads(queryset.explain(format='json'))[0]
+            return int(plan['Plan']['Plan Rows']), True
+        count = queryset[:ESTIMATE_CAP].count()
+        return count, count == ESTIMATE_CAP
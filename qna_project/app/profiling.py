@@ -0,0 +1,138 @@
+import contextvars
+import heapq
+import re
+import time
+from collections import Counter
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template import base
+
+# profile of the request being handled, None when it isn't sampled
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+# `IN (%s, %s, ...)` lists of any length are one query shape
+IN_LIST_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+
+
+def query_shape(sql):
+    return IN_LIST_RE.sub('(...)', sql)
+
+
+class RequestProfile:
+    """
+    Collects the queries and template render time of one request.
+
+    Installed as a connection execute_wrapper, so it sees the SQL with its
+    placeholders: the same statement with different params has the same shape,
+    and a shape repeated many times is an N+1 pattern.
+    """
+    def __init__(self, slowest=3):
+        self.started = time.perf_counter()
+        self.duration = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.shapes = Counter()
+        self.rendering = False
+
+        # min-heap of (duration, sql), keeps only the `slowest` statements
+        self._slowest = []
+        self._slowest_size = slowest
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.sql_time += duration
+            self.shapes[query_shape(sql)] += 1
+            if len(self._slowest) < self._slowest_size:
+                heapq.heappush(self._slowest, (duration, sql))
+            elif self._slowest and duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (duration, sql))
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def slowest(self):
+        return sorted(self._slowest, reverse=True)
+
+    def repeated(self, threshold):
+        """Query shapes issued at least `threshold` times, most repeated first."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def server_timing(self):
+        # template time includes the queries that templates trigger lazily
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.duration * 1000:.1f}',
+        ])
+
+    def as_dict(self, threshold, sql_length=300):
+        return {
+            'duration_ms': round(self.duration * 1000, 1),
+            'queries': self.queries,
+            'sql_ms': round(self.sql_time * 1000, 1),
+            'template_ms': round(self.template_time * 1000, 1),
+            'slowest': [
+                {'ms': round(duration * 1000, 1), 'sql': sql[:sql_length]}
+                for duration, sql in self.slowest()
+            ],
+            'repeated': [
+                {'count': count, 'sql': shape[:sql_length]}
+                for shape, count in self.repeated(threshold)
+            ],
+        }
+
+
+def profile_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection: hands the query to the current
+    request's profile. The profile lives in a ContextVar, which sync_to_async copies
+    into worker threads, so queries an async view runs on other threads count too.
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def _add_query_wrapper(connection, **kwargs):
+    # at the bottom of the stack: execute_wrapper() blocks pop() whatever is on top
+    if profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, profile_query)
+
+
+def install_query_hook():
+    connection_created.connect(_add_query_wrapper, dispatch_uid='app.profiling')
+    for connection in connections.all(initialized_only=True):
+        _add_query_wrapper(connection)
+
+
+def _timed_render(render):
+    def timed_render(self, context):
+        profile = current_profile.get()
+        # {% include %} and render_to_string inside a render are already being timed
+        if profile is None or profile.rendering:
+            return render(self, context)
+
+        profile.rendering = True
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            profile.template_time += time.perf_counter() - started
+            profile.rendering = False
+
+    timed_render.untimed = render
+    return timed_render
+
+
+def install_template_timer():
+    """Wraps Template.render once per process; costs one ContextVar lookup when not profiling."""
+    if not hasattr(base.Template.render, 'untimed'):
+        base.Template.render = _timed_render(base.Template.render)
@@ -0,0 +1,60 @@
+import datetime
+import math
+
+from django.conf import settings
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Cast, Greatest, Ln, Sign
+
+from .models import Question
+
+# scores count time from here; any fixed moment works, it only has to never change
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def hot_score(rating, answers_count, created_at):
+    """
+    log10 of the question's points plus its creation time in HOT_SCORE_TIMESCALE units:
+    10x the points are worth as much as being that much newer. The score of a question
+    only changes when it is voted on or answered, and scores computed at different
+    moments stay comparable, so nothing has to decay them.
+    """
+    points = rating + settings.HOT_SCORE_ANSWER_WEIGHT * answers_count
+    activity = math.copysign(math.log10(max(abs(points), 1)), points)
+    return activity + (created_at - EPOCH).total_seconds() / settings.HOT_SCORE_TIMESCALE
+
+
+def _activity(rating, answers_count):
+    # the points part of hot_score() as an SQL expression
+    points = rating + settings.HOT_SCORE_ANSWER_WEIGHT * answers_count
+    # log10 as ln / ln(10): PostgreSQL has no two-argument log() for floats
+    log10 = Ln(Cast(Greatest(Abs(points), Value(1)), FloatField())) / Value(math.log(10))
+    return Cast(Sign(points), FloatField()) * log10
+
+
+def hot_score_change(rating=0, answers_count=0):
+    """
+    The new hot_score for an UPDATE that also changes rating and/or answers_count by these deltas.
+    The time part of a score never changes, so only the points part is replaced.
+    """
+    return (
+        F('hot_score')
+        + _activity(F('rating') + rating, F('answers_count') + answers_count)
+        - _activity(F('rating'), F('answers_count'))
+    )
+
+
+def rebuild_hot_scores(batch_size=1000, model=Question):
+    """Recompute hot_score of every question, e.g. after bulk inserts or a change of the formula."""
+    queryset = model.objects.order_by('pk').only('pk', 'rating', 'answers_count', 'created_at', 'hot_score')
+
+    batch = []
+    updated = 0
+    for question in queryset.iterator(chunk_size=batch_size):
+        question.hot_score = hot_score(question.rating, question.answers_count, question.created_at)
+        batch.append(question)
+        if len(batch) >= batch_size:
+            updated += model.objects.bulk_update(batch, ['hot_score'])
+            batch = []
+    if batch:
+        updated += model.objects.bulk_update(batch, ['hot_score'])
+    return updated
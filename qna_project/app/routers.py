@@ -0,0 +1,136 @@
+"""
+Primary/replica routing.
+
+Reads go to a replica only inside views decorated with @replica_reads (the
+read-heavy pages), everything else - writes, transactions, admin, the vote
+endpoints - stays on `default`. A view picks one replica for its whole request,
+so a page never mixes data of replicas with different lag.
+
+After a write (any unsafe request) PrimaryPinMiddleware sets a short-lived cookie
+that keeps that client's reads on the primary until replicas have caught up.
+"""
+import contextvars
+import functools
+import itertools
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+PIN_COOKIE = 'primary_pin'
+
+# share of latency-based picks that go to a random replica instead,
+# so that the latency of a replica that has been avoided gets measured again
+EXPLORE_RATE = 0.05
+# weight of the newest sample in the moving average
+LATENCY_SMOOTHING = 0.2
+
+# the alias reads of the current request go to, None means the primary
+read_alias = contextvars.ContextVar('read_alias', default=None)
+
+_round_robin = itertools.count()
+_latency = {}
+
+
+def record_latency(alias, seconds):
+    previous = _latency.get(alias)
+    _latency[alias] = seconds if previous is None else previous + LATENCY_SMOOTHING * (seconds - previous)
+
+
+def select_replica():
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas:
+        return None
+    if settings.REPLICA_SELECTION == 'least_latency' and random.random() >= EXPLORE_RATE:
+        # unmeasured replicas first
+        return min(replicas, key=lambda alias: _latency.get(alias, 0))
+    return replicas[next(_round_robin) % len(replicas)]
+
+
+def is_pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def replica_reads(view):
+    """Sends the view's reads to a replica, unless the client has just written something."""
+    def choose(request):
+        # inside a transaction (ATOMIC_REQUESTS, tests) reads must see its writes
+        if is_pinned(request) or connections['default'].in_atomic_block:
+            return None
+        return select_replica()
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = read_alias.set(choose(request))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            read_alias.reset(token)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related objects come from where their parent came from
+            return instance._state.db
+        return read_alias.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class PrimaryPinMiddleware:
+    """Pins the client to the primary for REPLICA_STICKY_SECONDS after any unsafe request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.pin(request, await self.get_response(request))
+
+    def pin(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') and settings.DATABASE_REPLICAS:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True, samesite='Lax')
+        return response
+
+
+def _time_replica_queries(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record_latency(context['connection'].alias, time.perf_counter() - started)
+
+
+def _add_latency_wrapper(connection, **kwargs):
+    if connection.alias in settings.DATABASE_REPLICAS and _time_replica_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _time_replica_queries)
+
+
+def install_latency_hook():
+    connection_created.connect(_add_latency_wrapper, dispatch_uid='app.routers')
@@ -0,0 +1,223 @@
+import functools
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, SearchVectorField
+from django.db import connection, transaction
+from django.db.models import Count, F, Func, OuterRef, Subquery, Sum, TextField, Value
+from django.db.models.expressions import CombinedExpression
+from django.db.models.functions import Coalesce
+
+from .models import Question, Answer, SearchTerm
+
+WORD_RE = re.compile(r'\w+')
+
+# weights of the inverted index fallback, mirroring A/B/C of the tsvector
+TITLE_WEIGHT = 4
+TEXT_WEIGHT = 2
+ANSWER_WEIGHT = 1
+
+MAX_TERM_LENGTH = 64
+
+
+def full_text_supported():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    return [
+        word for word in WORD_RE.findall(text.lower())
+        if 1 < len(word) <= MAX_TERM_LENGTH
+    ]
+
+
+def _answers_text():
+    return Coalesce(
+        Subquery(
+            Answer.objects.filter(question=OuterRef('pk'))
+            .order_by()
+            .values('question')
+            .annotate(text=StringAgg('text', ' '))
+            .values('text')
+        ),
+        Value('', output_field=TextField()),
+    )
+
+
+def index_question(question_id):
+    """
+    Rebuild the search data of one question (its title, text and all its answers).
+    Costs as much as the question has answers: writes go through the
+    incremental functions below instead, this is for rebuilds.
+    """
+    if full_text_supported():
+        config = settings.SEARCH_CONFIG
+        Question.objects.filter(pk=question_id).update(search_vector=(
+            SearchVector('title', weight='A', config=config)
+            + SearchVector('text', weight='B', config=config)
+            + SearchVector(_answers_text(), weight='C', config=config)
+        ))
+        return
+
+    try:
+        title, text = Question.objects.values_list('title', 'text').get(pk=question_id)
+    except Question.DoesNotExist:
+        return
+
+    weights = term_weights(title, TITLE_WEIGHT) + term_weights(text, TEXT_WEIGHT)
+    for answer in Answer.objects.filter(question_id=question_id).values_list('text', flat=True):
+        weights.update(term_weights(answer, ANSWER_WEIGHT))
+
+    SearchTerm.objects.filter(question_id=question_id).delete()
+    SearchTerm.objects.bulk_create(
+        SearchTerm(term=term, question_id=question_id, weight=weight)
+        for term, weight in weights.items()
+    )
+
+
+def term_weights(text, weight):
+    weights = Counter()
+    for word in tokenize(text):
+        weights[word] += weight
+    return weights
+
+
+def _change_terms(question_id, added, removed):
+    """Adds the `added` and takes away the `removed` term weights of the question's inverted index."""
+    deltas = Counter(added)
+    deltas.subtract(removed)
+    deltas = {term: delta for term, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    created, changed, emptied = [], [], []
+    existing = {row.term: row for row in SearchTerm.objects.filter(question_id=question_id, term__in=deltas)}
+    for term, delta in deltas.items():
+        row = existing.get(term)
+        if row is None:
+            if delta > 0:
+                created.append(SearchTerm(term=term, question_id=question_id, weight=delta))
+        elif row.weight + delta > 0:
+            row.weight += delta
+            changed.append(row)
+        else:
+            emptied.append(row.pk)
+
+    SearchTerm.objects.bulk_create(created)
+    SearchTerm.objects.bulk_update(changed, ['weight'])
+    SearchTerm.objects.filter(pk__in=emptied).delete()
+
+
+class WeightFilter(Func):
+    # the lexemes of a tsvector with the given weights, e.g. only those of the answers
+    function = 'ts_filter'
+    output_field = SearchVectorField()
+
+
+def _stored_vector():
+    return Coalesce(F('search_vector'), Value('', output_field=SearchVectorField()))
+
+
+def _concat(*vectors):
+    return functools.reduce(
+        lambda left, right: CombinedExpression(left, '||', right, output_field=SearchVectorField()),
+        vectors,
+    )
+
+
+def index_question_text(question_id, title, text, old_title='', old_text=''):
+    """Reindexes the question's own title and text, leaving the part of its answers as it is."""
+    if full_text_supported():
+        config = settings.SEARCH_CONFIG
+        Question.objects.filter(pk=question_id).update(search_vector=_concat(
+            SearchVector(Value(title), weight='A', config=config),
+            SearchVector(Value(text), weight='B', config=config),
+            WeightFilter(_stored_vector(), Value('{c}')),
+        ))
+        return
+
+    _change_terms(
+        question_id,
+        term_weights(title, TITLE_WEIGHT) + term_weights(text, TEXT_WEIGHT),
+        term_weights(old_title, TITLE_WEIGHT) + term_weights(old_text, TEXT_WEIGHT),
+    )
+
+
+def index_answer(question_id, text, old_text=''):
+    """Adds a new or edited answer's text to its question's search data; old_text is None if it wasn't loaded."""
+    if old_text is None or (old_text and full_text_supported()):
+        # a tsvector can't tell which answer a lexeme came from
+        reindex_on_commit(question_id)
+        return
+    if full_text_supported():
+        Question.objects.filter(pk=question_id).update(search_vector=_concat(
+            _stored_vector(),
+            SearchVector(Value(text), weight='C', config=settings.SEARCH_CONFIG),
+        ))
+        return
+
+    _change_terms(question_id, term_weights(text, ANSWER_WEIGHT), term_weights(old_text, ANSWER_WEIGHT))
+
+
+def unindex_answer(question_id, text):
+    if text is None or full_text_supported():
+        reindex_on_commit(question_id)
+        return
+    _change_terms(question_id, Counter(), term_weights(text, ANSWER_WEIGHT))
+
+
+def reindex_on_commit(question_id):
+    """
+    Full reindex of the question once the transaction commits, for the changes
+    (answer edits and deletions on PostgreSQL) that can't be applied incrementally.
+    """
+    transaction.on_commit(lambda: index_question(question_id))
+
+
+def rebuild_index(batch_size=1000):
+    if full_text_supported():
+        # one statement per batch instead of one per question
+        config = settings.SEARCH_CONFIG
+        ids = list(Question.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(ids), batch_size):
+            Question.objects.filter(pk__in=ids[start:start + batch_size]).update(search_vector=(
+                SearchVector('title', weight='A', config=config)
+                + SearchVector('text', weight='B', config=config)
+                + SearchVector(_answers_text(), weight='C', config=config)
+            ))
+        return len(ids)
+
+    count = 0
+    for question_id in Question.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size):
+        index_question(question_id)
+        count += 1
+    return count
+
+
+def search_questions(text):
+    """
+    Questions matching every word of `text`, annotated with `rank` and
+    ordered by relevance (ties broken by id, so the result can be cursor-paginated).
+    """
+    if full_text_supported():
+        query = SearchQuery(text, search_type='websearch', config=settings.SEARCH_CONFIG)
+        return (
+            Question.objects
+            .filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', '-id')
+        )
+
+    terms = set(tokenize(text))
+    if not terms:
+        return Question.objects.none()
+
+    return (
+        Question.objects
+        .filter(search_terms__term__in=terms)
+        .annotate(rank=Sum('search_terms__weight'), matched=Count('search_terms'))
+        .filter(matched=len(terms))
+        .order_by('-rank', '-id')
+    )
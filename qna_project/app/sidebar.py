@@ -0,0 +1,68 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Tag, Profile
+
+SIDEBAR_KEY = 'sidebar'
+SIDEBAR_LOCK_KEY = 'sidebar:lock'
+SIDEBAR_SIZE = 7
+
+# a crashed refresh must not block the next one forever
+LOCK_TIMEOUT = 60
+
+
+def compute_sidebar():
+    return {
+        'tags': list(Tag.objects.most_popular()[:SIDEBAR_SIZE]),
+        'profiles': list(Profile.objects.most_active()[:SIDEBAR_SIZE]),
+    }
+
+
+def refresh_sidebar():
+    """Recompute the sidebar and store it; the entry itself never expires, only goes stale."""
+    data = compute_sidebar()
+    cache.set(SIDEBAR_KEY, {
+        'data': data,
+        'stale_at': time.time() + settings.SIDEBAR_CACHE_TTL,
+    }, timeout=None)
+    return data
+
+
+def _refresh_locked():
+    try:
+        return refresh_sidebar()
+    finally:
+        cache.delete(SIDEBAR_LOCK_KEY)
+
+
+def _refresh_in_background():
+    try:
+        _refresh_locked()
+    finally:
+        connection.close()
+
+
+def get_sidebar():
+    """
+    Returns cached sidebar data.
+    Only the worker that wins the lock recomputes an expired entry,
+    everybody else keeps serving the stale copy meanwhile.
+    """
+    entry = cache.get(SIDEBAR_KEY)
+    
+    if entry is None:
+        if cache.add(SIDEBAR_LOCK_KEY, 1, LOCK_TIMEOUT):
+            return _refresh_locked()
+        return {'tags': [], 'profiles': []}
+    
+    if entry['stale_at'] <= time.time() and cache.add(SIDEBAR_LOCK_KEY, 1, LOCK_TIMEOUT):
+        if settings.SIDEBAR_BACKGROUND_REFRESH:
+            threading.Thread(target=_refresh_in_background, daemon=True).start()
+        else:
+            return _refresh_locked()
+    
+    return entry['data']
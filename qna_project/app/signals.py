@@ -0,0 +1,254 @@
+from django.db.models import F
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import tagindex
+from .avatars import update_thumbnails
+from .events import publish, topic_for
+from .models import Question, Answer, Tag, Profile, ProfileStats, QuestionVote, AnswerVote
+from .ranking import hot_score, hot_score_change
+from .search import index_answer, index_question_text, reindex_on_commit, unindex_answer
+from .stats import change_profile_stats
+from .surrogates import purge
+from .votes import change_question_rating, change_answer_rating
+
+
+def _remember_value(instance):
+    # value as it is stored in the db, used to turn a save into a rating delta
+    instance._stored_value = instance.value if instance.pk else 0
+
+
+@receiver(post_init, sender=QuestionVote)
+@receiver(post_init, sender=AnswerVote)
+def vote_init(sender, instance, **kwargs):
+    _remember_value(instance)
+
+
+@receiver(post_save, sender=QuestionVote)
+def question_vote_saved(sender, instance, created, **kwargs):
+    delta = instance.value - (0 if created else instance._stored_value)
+    if delta:
+        change_question_rating(instance.question_id, delta)
+    _remember_value(instance)
+
+
+@receiver(post_delete, sender=QuestionVote)
+def question_vote_deleted(sender, instance, **kwargs):
+    change_question_rating(instance.question_id, -instance._stored_value)
+
+
+@receiver(post_save, sender=AnswerVote)
+def answer_vote_saved(sender, instance, created, **kwargs):
+    delta = instance.value - (0 if created else instance._stored_value)
+    if delta:
+        change_answer_rating(instance.answer_id, delta)
+    _remember_value(instance)
+
+
+@receiver(post_delete, sender=AnswerVote)
+def answer_vote_deleted(sender, instance, **kwargs):
+    change_answer_rating(instance.answer_id, -instance._stored_value)
+
+
+def _stored_avatar(instance):
+    # reads __dict__ like answer_init, a deferred avatar_image counts as unchanged
+    image = instance.__dict__.get('avatar_image')
+    return getattr(image, 'name', image) or ''
+
+
+def _shown_fields(instance):
+    # what pages show of a profile next to its posts; deferred fields count as unchanged
+    return instance.__dict__.get('nickname'), instance.__dict__.get('avatar_url')
+
+
+@receiver(post_init, sender=Profile)
+def profile_init(sender, instance, **kwargs):
+    instance._stored_avatar_image = _stored_avatar(instance) if instance.pk else ''
+    instance._stored_shown_fields = _shown_fields(instance)
+
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, created, **kwargs):
+    if created:
+        ProfileStats.objects.get_or_create(profile=instance)
+    changed = _shown_fields(instance) != instance._stored_shown_fields
+    if 'avatar_image' in instance.__dict__ and _stored_avatar(instance) != instance._stored_avatar_image:
+        update_thumbnails(instance)
+        changed = True
+    if changed and not created:
+        purge(f'profile:{instance.pk}')
+    instance._stored_shown_fields = _shown_fields(instance)
+
+
+@receiver(post_init, sender=Answer)
+def answer_init(sender, instance, **kwargs):
+    # like _remember_value, turns a save into an accepted answers delta;
+    # reads __dict__ so that a deferred is_correct doesn't cost a query per answer
+    instance._stored_is_correct = bool(instance.__dict__.get('is_correct')) if instance.pk else False
+    # the indexed text, None while deferred
+    instance._stored_text = instance.__dict__.get('text') if instance.pk else ''
+
+
+@receiver(pre_save, sender=Answer)
+def answer_saving(sender, instance, **kwargs):
+    # stats before the answer and question rows, the lock order of app.votes
+    change_profile_stats(
+        instance.profile_id,
+        answer_count=int(instance._state.adding),
+        accepted_answer_count=bool(instance.is_correct) - instance._stored_is_correct,
+    )
+
+
+@receiver(post_save, sender=Answer)
+def answer_saved(sender, instance, created, **kwargs):
+    if created:
+        Question.objects.filter(pk=instance.question_id).update(
+            answers_count=F('answers_count') + 1,
+            version=F('version') + 1,
+            hot_score=hot_score_change(answers_count=1),
+        )
+        publish(topic_for(instance.question_id), 'answer', {'id': instance.pk})
+    instance._stored_is_correct = bool(instance.is_correct)
+    if 'text' in instance.__dict__ and instance.text != instance._stored_text:
+        index_answer(instance.question_id, instance.text, instance._stored_text)
+        instance._stored_text = instance.text
+    purge(f'question:{instance.question_id}', 'feed:hot')
+
+
+@receiver(pre_delete, sender=Answer)
+def answer_deleting(sender, instance, **kwargs):
+    # stats before the answer and question rows, like answer_saving
+    change_profile_stats(instance.profile_id, answer_count=-1, accepted_answer_count=-instance._stored_is_correct)
+
+
+@receiver(post_delete, sender=Answer)
+def answer_deleted(sender, instance, **kwargs):
+    Question.objects.filter(pk=instance.question_id).update(
+        answers_count=F('answers_count') - 1,
+        version=F('version') + 1,
+        hot_score=hot_score_change(answers_count=-1),
+    )
+    unindex_answer(instance.question_id, instance.__dict__.get('text'))
+    purge(f'question:{instance.question_id}', f'answer:{instance.pk}', 'feed:hot')
+
+
+@receiver(post_init, sender=Question)
+def question_init(sender, instance, **kwargs):
+    # the indexed title and text, like answer_init; None while deferred
+    instance._stored_search_text = (
+        (instance.__dict__.get('title'), instance.__dict__.get('text')) if instance.pk else ('', '')
+    )
+
+
+@receiver(post_save, sender=Question)
+def question_saved(sender, instance, created, **kwargs):
+    if created:
+        Question.objects.filter(pk=instance.pk).update(
+            hot_score=hot_score(instance.rating, instance.answers_count, instance.created_at),
+        )
+        change_profile_stats(instance.profile_id, question_count=1)
+        purge('feed:index', 'feed:hot')
+    else:
+        bump_versions([instance.pk])
+    title, text = instance.__dict__.get('title'), instance.__dict__.get('text')
+    if (title, text) != instance._stored_search_text:
+        old_title, old_text = instance._stored_search_text
+        if None in (title, text, old_title, old_text):
+            # a deferred field: the old terms aren't known
+            reindex_on_commit(instance.pk)
+        else:
+            index_question_text(instance.pk, title, text, old_title, old_text)
+        instance._stored_search_text = (title, text)
+
+
+@receiver(pre_delete, sender=Question)
+def question_deleting(sender, instance, **kwargs):
+    # the links to tags are deleted without m2m_changed
+    instance._tag_pks = list(instance.tags.values_list('pk', flat=True))
+    # stats before the question row, the lock order of app.votes
+    change_profile_stats(instance.profile_id, question_count=-1)
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted(sender, instance, **kwargs):
+    tag_pks = getattr(instance, '_tag_pks', [])
+    Tag.objects.filter(pk__in=tag_pks).update(questions_count=F('questions_count') - 1)
+    for pk in tag_pks:
+        tagindex.on_commit('change_count', pk, -1)
+    purge(f'question:{instance.pk}', 'feed:index', 'feed:hot', *[f'tag:{pk}' for pk in tag_pks])
+
+
+def bump_versions(question_ids):
+    """Marks cards (app.fragments) and cached pages (app.surrogates) of these questions as changed."""
+    if not isinstance(question_ids, (list, set)):
+        question_ids = list(question_ids.values_list('pk', flat=True))
+    Question.objects.filter(pk__in=question_ids).update(version=F('version') + 1)
+    purge(*[f'question:{pk}' for pk in question_ids])
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def question_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # forward: instance is a question and pk_set holds tags, reverse: the other way round
+    own_column, other_column = ('tag_id', 'question_id') if reverse else ('question_id', 'tag_id')
+    
+    if action in ('pre_remove', 'pre_clear'):
+        # remove() reports every pk it was given, keep only the links that really go away
+        links = sender.objects.filter(**{own_column: instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{f'{other_column}__in': pk_set})
+        instance._unlinked_pks = set(links.values_list(other_column, flat=True))
+        return
+    
+    if action == 'post_add':
+        changed, delta = pk_set, 1
+    elif action in ('post_remove', 'post_clear'):
+        changed, delta = instance._unlinked_pks, -1
+    else:
+        return
+    if not changed:
+        return
+    
+    if not reverse:
+        Tag.objects.filter(pk__in=changed).update(questions_count=F('questions_count') + delta)
+        for pk in changed:
+            tagindex.on_commit('change_count', pk, delta)
+        bump_versions([instance.pk])
+        purge(*[f'tag:{pk}' for pk in changed])
+    else:
+        Tag.objects.filter(pk=instance.pk).update(questions_count=F('questions_count') + delta * len(changed))
+        tagindex.on_commit('change_count', instance.pk, delta * len(changed))
+        bump_versions(list(changed))
+        purge(f'tag:{instance.pk}')
+
+
+@receiver(post_init, sender=Tag)
+def tag_init(sender, instance, **kwargs):
+    # the name as stored, like answer_init; None while deferred
+    instance._stored_name = instance.__dict__.get('name') if instance.pk else ''
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, **kwargs):
+    if created:
+        tagindex.on_commit('add', instance.pk, instance.name, instance.questions_count)
+    elif 'name' in instance.__dict__ and instance.name != instance._stored_name:
+        tagindex.on_commit('rename', instance.pk, instance.name)
+        # cards show tag names
+        bump_versions(instance.question_set.all())
+        purge(f'tag:{instance.pk}')
+    instance._stored_name = instance.__dict__.get('name')
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    # like question_deleting: the links go with the tag, without m2m_changed
+    instance._question_pks = list(instance.question_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    tagindex.on_commit('remove', instance.pk)
+    # cards show tag names
+    bump_versions(getattr(instance, '_question_pks', []))
+    # the feeds list those cards, the tag's own page is gone
+    purge(f'tag:{instance.pk}', 'feed:index', 'feed:hot')
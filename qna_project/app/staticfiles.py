@@ -0,0 +1,131 @@
+"""
+Static files served by the app itself (StaticAssetMiddleware), no web server needed in front.
+
+`collectstatic` fingerprints every file (style.css -> style.3f2a9c1e.css, references
+inside CSS are rewritten too) and writes .gz and, with the optional `brotli`
+package, .br siblings of everything compressible. Fingerprinted URLs change
+with their content, so they are served as immutable for a year: repeat visits
+don't request them at all.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico'}
+
+# a compressed copy that saves less than this isn't worth the Content-Encoding
+MIN_SAVING = 0.05
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# unfingerprinted names (a hard-coded /static/... link) revalidate with the ETag
+REVALIDATE = 'public, max-age=0, must-revalidate'
+
+# preferred order when the client accepts several
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def compress(data):
+    """{'.gz': bytes, '.br': bytes} for the encodings that make `data` noticeably smaller."""
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return {
+        suffix: content for suffix, content in variants.items()
+        if len(content) < len(data) * (1 - MIN_SAVING)
+    }
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        written = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if not isinstance(processed, Exception):
+                written.update(filter(None, [name, hashed_name]))
+        if dry_run:
+            return
+
+        # the final hashed names, earlier passes may have yielded intermediate ones
+        for name in written & (set(paths) | set(self.hashed_files.values())):
+            if os.path.splitext(name)[1] in COMPRESSIBLE_EXTENSIONS:
+                self.write_compressed(name)
+
+    def write_compressed(self, name):
+        with self.open(name) as f:
+            data = f.read()
+        for suffix in ('.gz', '.br'):
+            if os.path.exists(self.path(name) + suffix):
+                os.remove(self.path(name) + suffix)
+        for suffix, content in compress(data).items():
+            with open(self.path(name) + suffix, 'wb') as f:
+                f.write(content)
+
+    def url(self, name, force=False):
+        if not self.hashed_files and not force:
+            # collectstatic hasn't run (development, tests): link the source files
+            return FileSystemStorage.url(self, name)
+        return super().url(name, force)
+
+
+class StaticAsset:
+    def __init__(self, path, immutable):
+        self.path = path
+        self.cache_control = IMMUTABLE if immutable else REVALIDATE
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'image/svg+xml'):
+            self.content_type += '; charset=utf-8'
+
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:20]
+        # strong ETags have to differ between encodings of the same file
+        self.variants = {None: (path, os.path.getsize(path), f'"{digest}"')}
+        for encoding, suffix in ENCODINGS:
+            if os.path.exists(path + suffix):
+                self.variants[encoding] = (path + suffix, os.path.getsize(path + suffix), f'"{digest}-{encoding}"')
+
+    def variant(self, accepted):
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and encoding in accepted:
+                return encoding, self.variants[encoding]
+        return None, self.variants[None]
+
+
+def accepted_encodings(header):
+    """Encodings of an Accept-Encoding header that aren't refused with q=0."""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        params = params.replace(' ', '')
+        if coding and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip().lower())
+    if '*' in accepted:
+        accepted.update(encoding for encoding, _ in ENCODINGS)
+    return accepted
+
+
+def collected_assets():
+    """URL path -> StaticAsset for everything in STATIC_ROOT, empty before collectstatic."""
+    root = settings.STATIC_ROOT
+    if not root or not os.path.isdir(root):
+        return {}
+
+    fingerprinted = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+    assets = {}
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            if filename.endswith(('.gz', '.br')) and os.path.exists(path[:-3]):
+                continue
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            assets[settings.STATIC_URL + name] = StaticAsset(path, name in fingerprinted)
+    return assets
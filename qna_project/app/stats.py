@@ -0,0 +1,19 @@
+from django.db.models import F, Subquery
+
+from .models import ProfileStats
+
+
+def author_of(model, pk):
+    """The author's id as a subquery, so their stats can be updated without fetching the row first."""
+    return Subquery(model.objects.filter(pk=pk).order_by().values('profile_id')[:1])
+
+
+def change_profile_stats(profile_id, **deltas):
+    """
+    Adds deltas to the counters of a profile's stats row, e.g.
+    change_profile_stats(profile_id, answer_count=1, rating_received=-2).
+    `profile_id` may also be an author_of() subquery.
+    """
+    deltas = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if deltas:
+        ProfileStats.objects.filter(pk=profile_id).update(**deltas)
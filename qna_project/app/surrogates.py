@@ -0,0 +1,68 @@
+"""
+Surrogate keys name the things a cached page was built from ("question:12",
+"tag:3", "profile:5", "feed:index"). Every key has a version in the cache;
+purging a key gives it a new version, which makes every page stored under the
+old one stale.
+
+Versions live in the default cache, so a purge reaches exactly the processes
+that share it: with the per-process locmem backend other workers keep serving
+their pages until PAGE_CACHE_TTL. `check --deploy` warns about that.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_PREFIX = 'sk:'
+
+
+def add_surrogate_keys(request, *keys):
+    if not hasattr(request, 'surrogate_keys'):
+        request.surrogate_keys = set()
+    request.surrogate_keys.update(keys)
+
+
+def question_keys(questions):
+    """Keys of a page of question cards: the questions and their authors (nickname, avatar)."""
+    return [key for question in questions for key in (f'question:{question.pk}', f'profile:{question.profile_id}')]
+
+
+def thread_keys(question, answers):
+    """Keys of a question page: the question, its answers on the page and all of their authors."""
+    return [
+        f'question:{question.pk}',
+        f'profile:{question.profile_id}',
+        *[key for answer in answers for key in (f'answer:{answer.pk}', f'profile:{answer.profile_id}')],
+    ]
+
+
+def key_versions(keys, purged_after=None):
+    """
+    Current versions of `keys`; keys the cache doesn't know get one now.
+    With `purged_after` (a time.time_ns() value) returns None instead if
+    any of the keys has been purged since then.
+    """
+    stored = cache.get_many([VERSION_PREFIX + key for key in keys])
+    versions = {}
+    missing = {}
+    for key in keys:
+        version = stored.get(VERSION_PREFIX + key)
+        if version is None:
+            version = missing[VERSION_PREFIX + key] = time.time_ns()
+        elif purged_after is not None and version > purged_after:
+            return None
+        versions[key] = version
+    if missing:
+        cache.set_many(missing, timeout=None)
+    return versions
+
+
+def purge(*keys):
+    """Invalidates every cached page tagged with any of `keys` once the current transaction commits."""
+    if not keys:
+        return
+    new_version = time.time_ns()
+    transaction.on_commit(lambda: cache.set_many(
+        {VERSION_PREFIX + key: new_version for key in keys},
+        timeout=None,
+    ))
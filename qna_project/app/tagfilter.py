@@ -0,0 +1,55 @@
+"""
+Tag expressions of the tag feed: /tag/python+django-java is questions tagged
+python and django but not java.
+
+Tag names may contain + and - themselves (c++, scikit-learn), so the expression
+is split on every operator and the pieces are glued back into the longest
+existing tag names; all candidate names are looked up in one query.
+"""
+import functools
+import re
+
+from .models import Tag
+
+OPERATORS_RE = re.compile(r'([+-])')
+
+# pieces of an expression, i.e. names and operators
+MAX_PIECES = 31
+
+
+def parse_tags(expression):
+    """
+    Returns (include, exclude) lists of Tags, or None when the expression
+    doesn't read as existing tags with at least one tag to include.
+    """
+    pieces = OPERATORS_RE.split(expression)
+    if len(pieces) > MAX_PIECES:
+        return None
+
+    # names sit at the even positions, a name may span several of them
+    spans = {
+        (start, end): ''.join(pieces[start:end + 1])
+        for start in range(0, len(pieces), 2)
+        for end in range(start, len(pieces), 2)
+    }
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=set(spans.values()))}
+
+    @functools.cache
+    def terms_from(start):
+        if start == len(pieces) + 1:
+            return ()
+        sign = pieces[start - 1] if start else '+'
+        # longest names first: "scikit-learn" before "scikit" minus "learn"
+        for end in range(len(pieces) - 1, start - 1, -2):
+            tag = tags.get(spans[start, end])
+            rest = terms_from(end + 2) if tag is not None else None
+            if rest is not None:
+                return ((sign, tag),) + rest
+        return None
+
+    terms = terms_from(0)
+    if not terms:
+        return None
+    include = [tag for sign, tag in terms if sign == '+']
+    exclude = [tag for sign, tag in terms if sign == '-']
+    return (include, exclude) if include else None
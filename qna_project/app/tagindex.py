@@ -0,0 +1,223 @@
+"""
+In-process prefix index of tag names for autocomplete (/api/tags/suggest).
+
+Tags are kept sorted by lowercased name in blocks of up to 2 * BLOCK_SIZE (a
+block shrinking below BLOCK_SIZE // 2 is merged into a neighbour), so the tags
+starting with a prefix are one contiguous run found with bisect.
+Every block caches its MAX_LIMIT most used tags in order: a query lazily
+merges the cached tops of the blocks inside the run, scans only the two
+blocks at its edges and stops after `limit` tags, whatever the number of
+matching tags.
+
+Changes made by this process are applied in place by app.signals once they
+commit (a count change invalidates one block's top). Changes made by other
+processes arrive with the next rebuild, done in the background once the index
+is older than TAG_INDEX_TTL.
+"""
+import bisect
+import heapq
+import itertools
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Tag
+
+BLOCK_SIZE = 128
+MAX_LIMIT = 20
+
+# sorts after every character a tag name can continue with
+END = '\U0010ffff'
+
+
+def sort_key(name):
+    # names are unique but may differ only in case
+    return f'{name.lower()}\x00{name}'
+
+
+class Block:
+    __slots__ = ('keys', 'entries', '_top')
+
+    def __init__(self, keys, entries):
+        self.keys = keys
+        # [pk, name, questions_count], parallel to keys
+        self.entries = entries
+        self._top = None
+
+    def top(self):
+        if self._top is None:
+            self._top = heapq.nsmallest(MAX_LIMIT, self.entries, key=rank)
+        return self._top
+
+
+def rank(entry):
+    # most used first, then alphabetically
+    return -entry[2], entry[1]
+
+
+class TagIndex:
+    def __init__(self, rows):
+        """rows: (pk, name, questions_count) of every tag."""
+        entries = sorted(([pk, name, count] for pk, name, count in rows), key=lambda entry: sort_key(entry[1]))
+        self.blocks = [
+            Block([sort_key(entry[1]) for entry in chunk], chunk)
+            for chunk in (entries[i:i + BLOCK_SIZE] for i in range(0, len(entries), BLOCK_SIZE))
+        ]
+        self.keys_by_pk = {entry[0]: sort_key(entry[1]) for entry in entries}
+        self.built_at = time.monotonic()
+        self._reindex_blocks()
+
+    def _reindex_blocks(self):
+        self.last_keys = [block.keys[-1] for block in self.blocks]
+
+    def __len__(self):
+        return len(self.keys_by_pk)
+
+    def suggest(self, prefix, limit=10):
+        """Up to `limit` (name, questions_count) starting with `prefix` (any case), most used first."""
+        low = prefix.lower()
+        high = low + END
+        limit = min(limit, MAX_LIMIT)
+
+        # every source is sorted by rank, so merging stops after `limit` entries
+        sources = []
+        for position in range(bisect.bisect_left(self.last_keys, low), len(self.blocks)):
+            block = self.blocks[position]
+            if block.keys[0] >= high:
+                break
+            if block.keys[0] >= low and block.keys[-1] < high:
+                sources.append(block.top())
+            else:
+                start = bisect.bisect_left(block.keys, low)
+                matches = block.entries[start:bisect.bisect_left(block.keys, high, start)]
+                sources.append(heapq.nsmallest(limit, matches, key=rank))
+        merged = heapq.merge(*sources, key=rank)
+        return [(name, count) for _, name, count in itertools.islice(merged, limit)]
+
+    def _locate(self, key):
+        position = bisect.bisect_left(self.last_keys, key)
+        if position == len(self.blocks):
+            return None, None
+        block = self.blocks[position]
+        index = bisect.bisect_left(block.keys, key)
+        if index == len(block.keys) or block.keys[index] != key:
+            return position, None
+        return position, index
+
+    def change_count(self, pk, delta):
+        key = self.keys_by_pk.get(pk)
+        if key is None:
+            return
+        position, index = self._locate(key)
+        block = self.blocks[position]
+        block.entries[index][2] += delta
+        block._top = None
+
+    def add(self, pk, name, count=0):
+        self.remove(pk)
+        key = sort_key(name)
+        self.keys_by_pk[pk] = key
+        if not self.blocks:
+            self.blocks.append(Block([key], [[pk, name, count]]))
+            self._reindex_blocks()
+            return
+
+        position = min(bisect.bisect_left(self.last_keys, key), len(self.blocks) - 1)
+        block = self.blocks[position]
+        index = bisect.bisect_left(block.keys, key)
+        block.keys.insert(index, key)
+        block.entries.insert(index, [pk, name, count])
+        block._top = None
+        if len(block.keys) > 2 * BLOCK_SIZE:
+            self.blocks[position:position + 1] = [
+                Block(block.keys[:BLOCK_SIZE], block.entries[:BLOCK_SIZE]),
+                Block(block.keys[BLOCK_SIZE:], block.entries[BLOCK_SIZE:]),
+            ]
+        self._reindex_blocks()
+
+    def rename(self, pk, name):
+        """Moves a tag to its new name; its count is the index's own, a saved instance may hold a stale one."""
+        key = self.keys_by_pk.get(pk)
+        if key is None:
+            return
+        position, index = self._locate(key)
+        self.add(pk, name, self.blocks[position].entries[index][2])
+
+    def remove(self, pk):
+        key = self.keys_by_pk.pop(pk, None)
+        if key is None:
+            return
+        position, index = self._locate(key)
+        block = self.blocks[position]
+        del block.keys[index]
+        del block.entries[index]
+        block._top = None
+        if len(block.keys) < BLOCK_SIZE // 2 and len(self.blocks) > 1:
+            self._merge(position)
+        elif not block.keys:
+            del self.blocks[position]
+        self._reindex_blocks()
+
+    def _merge(self, position):
+        # with the following block, the last one with the previous; split again if that is too big
+        start = min(position, len(self.blocks) - 2)
+        first, second = self.blocks[start:start + 2]
+        keys, entries = first.keys + second.keys, first.entries + second.entries
+        if len(keys) > 2 * BLOCK_SIZE:
+            half = len(keys) // 2
+            merged = [Block(keys[:half], entries[:half]), Block(keys[half:], entries[half:])]
+        else:
+            merged = [Block(keys, entries)]
+        self.blocks[start:start + 2] = merged
+
+
+_index = None
+_lock = threading.Lock()
+_refreshing = False
+
+
+def build_index():
+    return TagIndex(Tag.objects.order_by().values_list('pk', 'name', 'questions_count').iterator(chunk_size=5000))
+
+
+def _rebuild_in_background():
+    global _index, _refreshing
+    try:
+        index = build_index()
+        with _lock:
+            _index = index
+    finally:
+        _refreshing = False
+        connection.close()
+
+
+def suggest(prefix, limit=10):
+    """
+    Suggestions from this process' index. The first call builds it, a stale one
+    keeps answering while it is rebuilt in the background.
+    """
+    global _index, _refreshing
+    with _lock:
+        if _index is None:
+            _index = build_index()
+        elif time.monotonic() - _index.built_at > settings.TAG_INDEX_TTL and not _refreshing:
+            _refreshing = True
+            threading.Thread(target=_rebuild_in_background, daemon=True).start()
+        return _index.suggest(prefix, limit)
+
+
+def reset_index():
+    global _index
+    with _lock:
+        _index = None
+
+
+def on_commit(method, *args):
+    """Applies a change to the index, if this process has one, once the transaction commits."""
+    def apply():
+        with _lock:
+            if _index is not None:
+                getattr(_index, method)(*args)
+    transaction.on_commit(apply)
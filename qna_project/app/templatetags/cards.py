@@ -0,0 +1,10 @@
+from django import template
+
+from app.fragments import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def question_cards(questions):
+    return render_cards(questions)
@@ -1,3 +1,1228 @@
-from django.test import TestCase
+import asyncio
+import base64
+import datetime
+import gzip
+import io
+import json
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import checks
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.templatetags.static import static
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import events, fragments, tagindex
+from .avatars import AVATAR_SIZES, thumbnail_path
+from .middleware import AnonymousPageCacheMiddleware
+from .models import Question, Answer, Profile, ProfileStats, SearchTerm, Tag, QuestionVote, AnswerVote
+from .pagination import CursorPaginator, InvalidCursor
+from .profiling import RequestProfile
+from .ranking import hot_score
+from .search import search_questions
+from .routers import PIN_COOKIE, PrimaryReplicaRouter, record_latency, replica_reads, select_replica
+from .views import ANSWERS_PER_PAGE
+from .votes import VoteTargetMissing, cast_vote
+
+
+def make_profile(username):
+    return Profile.objects.create(user=User.objects.create_user(username=username), nickname=username)
+
+
+def close_replica_pools():
+    # test replicas mirror the test database, their pooled sessions would block dropping it
+    for alias in settings.DATABASE_REPLICAS:
+        if hasattr(connections[alias], 'close_pool'):
+            connections[alias].close_pool()
+
+
+class VoteTests(TestCase):
+    def setUp(self):
+        self.author = make_profile('author')
+        self.question = Question.objects.create(title='How?', text='...', profile=self.author)
+        self.answer = Answer.objects.create(question=self.question, text='Like this', profile=self.author)
+        self.voter = make_profile('voter')
+        self.client.force_login(self.voter.user)
+
+    def vote(self, value, kind='question', target=None):
+        target = target or (self.question if kind == 'question' else self.answer)
+        return self.client.post(reverse(f'vote_{kind}', args=[target.id]), {'value': value})
+
+    def test_upvote_flip_retract(self):
+        self.assertEqual(self.vote(1).json()['rating'], 1)
+        self.assertEqual(self.vote(1).json()['rating'], 1)
+        self.assertEqual(self.vote(-1).json()['rating'], -1)
+        self.assertEqual(self.vote(0).json()['rating'], 0)
+        self.assertEqual(self.vote(0).json()['rating'], 0)
+
+        self.assertFalse(QuestionVote.objects.exists())
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.rating, 0)
+
+    def test_answer_vote(self):
+        self.assertEqual(self.vote(-1, kind='answer').json()['rating'], -1)
+        self.assertEqual(AnswerVote.objects.get().value, -1)
+        self.answer.refresh_from_db()
+        self.assertEqual(self.answer.rating, -1)
+
+    def test_rating_matches_votes(self):
+        for i in range(10):
+            voter = make_profile(f'voter{i}')
+            self.client.force_login(voter.user)
+            self.vote(1 if i % 3 else -1)
+            if i % 4 == 0:
+                self.vote(-1)
+
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.rating, sum(QuestionVote.objects.values_list('value', flat=True)))
+
+    def test_repeated_vote_writes_nothing(self):
+        self.vote(1)
+        version = Question.objects.values_list('version', flat=True).get(pk=self.question.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(cast_vote('question', self.question.pk, self.voter.pk, 1), 1)
+            self.assertEqual(cast_vote('answer', self.answer.pk, self.voter.pk, 0), 0)
+        self.assertEqual([query['sql'] for query in queries if query['sql'].startswith('UPDATE')], [])
+        self.assertEqual(Question.objects.values_list('version', flat=True).get(pk=self.question.pk), version)
+        with self.assertRaises(VoteTargetMissing):
+            cast_vote('question', 0, self.voter.pk, 0)
+
+    def test_vote_updates_rating_stats_and_hot_score_together(self):
+        with self.assertNumQueries(5):
+            # savepoint, vote, author's stats, question ... RETURNING, release
+            self.assertEqual(cast_vote('question', self.question.pk, self.voter.pk, 1), 1)
+        for voter in [make_profile('second'), make_profile('third')]:
+            cast_vote('question', self.question.pk, voter.pk, 1)
+        question = Question.objects.get(pk=self.question.pk)
+        self.assertAlmostEqual(question.hot_score, hot_score(3, 1, question.created_at))
+        self.assertEqual(ProfileStats.objects.get(pk=self.author.pk).rating_received, 3)
+
+    def test_edit_of_stale_instance_keeps_counters(self):
+        stale_question = Question.objects.get(pk=self.question.pk)
+        stale_answer = Answer.objects.get(pk=self.answer.pk)
+        self.vote(1)
+        self.vote(-1, kind='answer')
+        Answer.objects.create(question=self.question, text='Or this', profile=self.voter)
+        stored = Question.objects.get(pk=self.question.pk)
+
+        stale_question.title = 'Edited?'
+        stale_question.save()
+        stale_answer.text = 'Like that'
+        stale_answer.save()
+
+        question = Question.objects.get(pk=self.question.pk)
+        self.assertEqual(question.title, 'Edited?')
+        self.assertEqual((question.rating, question.answers_count), (1, 2))
+        self.assertEqual(question.hot_score, stored.hot_score)
+        self.assertGreater(question.version, stored.version)
+        self.assertEqual(Answer.objects.get(pk=self.answer.pk).rating, -1)
+
+    def test_answers_lock_stats_before_the_question(self):
+        def first_locked_table(write):
+            with CaptureQueriesContext(connection) as queries:
+                write()
+            for query in queries:
+                table = re.match(r'(?:UPDATE|DELETE FROM) "(app_profilestats|app_answer|app_question)"', query['sql'])
+                if table:
+                    return table[1]
+
+        answer = Answer(question=self.question, text='Mine', profile=self.author)
+        self.assertEqual(first_locked_table(answer.save), 'app_profilestats')
+        answer.is_correct = True
+        self.assertEqual(first_locked_table(answer.save), 'app_profilestats')
+        self.assertEqual(first_locked_table(answer.delete), 'app_profilestats')
+
+    def test_bad_requests(self):
+        self.assertEqual(self.vote(5).status_code, 400)
+        self.assertEqual(self.client.get(reverse('vote_question', args=[self.question.id])).status_code, 405)
+        self.assertEqual(self.client.post(reverse('vote_question', args=[0]), {'value': 1}).status_code, 404)
+
+        self.client.logout()
+        self.assertEqual(self.vote(1).status_code, 401)
+
+
+@skipIf(connection.vendor == 'sqlite', 'SQLite serializes writers, concurrency needs a real server')
+class ConcurrentVoteTests(TransactionTestCase):
+    VOTERS = 40
+
+    def test_concurrent_votes_are_exact(self):
+        author = make_profile('author')
+        question = Question.objects.create(title='Hot?', text='...', profile=author)
+        voters = [make_profile(f'voter{i}') for i in range(self.VOTERS)]
+        barrier = threading.Barrier(self.VOTERS)
+        errors = []
+
+        def run(voter, value):
+            from .votes import cast_vote
+            try:
+                barrier.wait()
+                cast_vote('question', question.id, voter.id, value)
+                # the same voter again, racing everybody else: flip, then repeat
+                cast_vote('question', question.id, voter.id, -value)
+                cast_vote('question', question.id, voter.id, -value)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=run, args=(voter, 1 if i % 2 else -1))
+            for i, voter in enumerate(voters)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        question.refresh_from_db()
+        self.assertEqual(QuestionVote.objects.count(), self.VOTERS)
+        self.assertEqual(question.rating, sum(QuestionVote.objects.values_list('value', flat=True)))
+
+
+class CursorPaginatorTests(TestCase):
+    def setUp(self):
+        author = make_profile('author')
+        self.questions = [Question.objects.create(title=f'Q{i}?', text='...', profile=author) for i in range(7)]
+        # ties on created_at are broken by the pk
+        tied = timezone.now()
+        Question.objects.filter(pk__in=[q.pk for q in self.questions[2:5]]).update(created_at=tied)
+        self.expected = list(Question.objects.recent().values_list('pk', flat=True))
+
+    def pks(self, page):
+        return [question.pk for question in page]
+
+    def test_round_trip(self):
+        paginator = CursorPaginator(Question.objects.recent(), per_page=3)
+        first = paginator.page()
+        self.assertFalse(first.has_previous())
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+        self.assertEqual(self.pks(first) + self.pks(second) + self.pks(third), self.expected)
+        self.assertFalse(third.has_next())
+
+        # and back again
+        self.assertEqual(self.pks(paginator.page(third.previous_cursor)), self.pks(second))
+        back = paginator.page(second.previous_cursor)
+        self.assertEqual(self.pks(back), self.pks(first))
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_malformed_cursors(self):
+        paginator = CursorPaginator(Question.objects.recent(), per_page=3)
+        for payload in ['not base64 json', '["x", [1, 2]]', '["n", [1]]', '["n", [5, 5]]',
+                        '["n", [null, null]]', '["n", ["2024-01-01T00:00:00+00:00", "x"]]', '["n", {}]']:
+            cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+            with self.assertRaises(InvalidCursor, msg=payload):
+                paginator.page(cursor)
+
+        # views fall back to the first page
+        for url in ['/', '/hot/']:
+            for payload in ['["n", [5, 5]]', '["n", [null, null]]', '["n", [[], {}]]']:
+                cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+                self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 200, (url, payload))
+        self.assertEqual(len(self.client.get('/', {'cursor': 'bm9wZQ'}).context['questions']), 7)
+
+
+class HotScoreTests(TestCase):
+    def setUp(self):
+        self.author = make_profile('author')
+        self.questions = [Question.objects.create(title=f'Q{i}?', text='...', profile=self.author) for i in range(3)]
+
+    def hot(self):
+        return [question.title for question in Question.objects.most_upvoted()]
+
+    def test_formula(self):
+        created_at = timezone.now()
+        newer = created_at + datetime.timedelta(seconds=settings.HOT_SCORE_TIMESCALE)
+        # 10x the points are worth one timescale of age
+        self.assertAlmostEqual(hot_score(100, 0, created_at), hot_score(10, 0, newer))
+        self.assertAlmostEqual(hot_score(5, 0, created_at), hot_score(1, 2, created_at))
+        self.assertLess(hot_score(-10, 0, created_at), hot_score(0, 0, created_at))
+        self.assertLess(hot_score(0, 0, created_at), hot_score(0, 0, newer))
+
+    def test_votes_and_answers_reorder(self):
+        self.assertEqual(self.hot(), ['Q2?', 'Q1?', 'Q0?'])
+        voters = [make_profile(f'voter{i}') for i in range(3)]
+        for voter in voters:
+            cast_vote('question', self.questions[0].pk, voter.pk, 1)
+        cast_vote('question', self.questions[2].pk, voters[0].pk, -1)
+        Answer.objects.create(question=self.questions[1], text='...', profile=self.author)
+        self.assertEqual(self.hot(), ['Q0?', 'Q1?', 'Q2?'])
+
+    def test_rebuild(self):
+        for voter in [self.author, make_profile('voter')]:
+            cast_vote('question', self.questions[0].pk, voter.pk, 1)
+        expected = list(Question.objects.order_by('pk').values_list('hot_score', flat=True))
+        Question.objects.update(hot_score=0)
+
+        call_command('rebuild_hot_scores', stdout=io.StringIO())
+        for score, rebuilt in zip(expected, Question.objects.order_by('pk').values_list('hot_score', flat=True)):
+            self.assertAlmostEqual(score, rebuilt)
+        self.assertEqual(self.hot(), ['Q0?', 'Q2?', 'Q1?'])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.author = make_profile('author')
+        self.in_title = Question.objects.create(title='Decorators explained', text='How do they work?', profile=self.author)
+        self.in_text = Question.objects.create(title='Wrapping functions', text='Are decorators slow?', profile=self.author)
+        self.in_answer = Question.objects.create(title='Caching results', text='What should I use?', profile=self.author)
+        self.answer = Answer.objects.create(question=self.in_answer, text='Memoizing decorators', profile=self.author)
+
+    def found(self, text):
+        return [question.pk for question in search_questions(text)]
+
+    def test_ranking(self):
+        # title over text over answers
+        self.assertEqual(self.found('decorators'), [self.in_title.pk, self.in_text.pk, self.in_answer.pk])
+        self.assertEqual(self.found('memoizing caching'), [self.in_answer.pk])
+        self.assertEqual(self.found('memoizing wrapping'), [])
+
+    def test_answers_are_indexed_as_they_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Answer.objects.create(question=self.in_answer, text='Try functools', profile=self.author)
+        self.assertEqual(self.found('functools'), [self.in_answer.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.answer.text = 'A dictionary'
+            self.answer.save()
+        self.assertEqual(self.found('memoizing'), [])
+        self.assertEqual(self.found('dictionary'), [self.in_answer.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertEqual(self.found('functools'), [])
+        self.assertEqual(self.found('dictionary'), [self.in_answer.pk])
+
+    def test_reindex_on_edit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.in_answer.title = 'Memoization'
+            self.in_answer.save()
+        self.assertEqual(self.found('caching'), [])
+        self.assertEqual(self.found('memoization'), [self.in_answer.pk])
+        # the answers stay indexed
+        self.assertEqual(self.found('memoizing'), [self.in_answer.pk])
+
+        # deferred fields: the old terms aren't known
+        with self.captureOnCommitCallbacks(execute=True):
+            question = Question.objects.only('pk').get(pk=self.in_answer.pk)
+            question.text = 'Any library?'
+            question.save()
+        self.assertEqual(self.found('library'), [self.in_answer.pk])
+        self.assertEqual(self.found('memoization memoizing'), [self.in_answer.pk])
+
+    def test_incremental_matches_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Answer.objects.create(question=self.in_title, text='Decorators wrap functions', profile=self.author)
+            self.in_text.text = 'Do decorators wrap slowly?'
+            self.in_text.save()
+            self.answer.delete()
+        queries = ['decorators', 'wrap', 'functions', 'memoizing', 'slowly']
+        incremental = {text: self.found(text) for text in queries}
+        if connection.vendor != 'postgresql':
+            terms = set(SearchTerm.objects.values_list('question_id', 'term', 'weight'))
+
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual({text: self.found(text) for text in queries}, incremental)
+        if connection.vendor != 'postgresql':
+            self.assertEqual(set(SearchTerm.objects.values_list('question_id', 'term', 'weight')), terms)
+
+    def test_new_answer_does_not_read_the_other_answers(self):
+        for i in range(20):
+            Answer.objects.create(question=self.in_answer, text=f'Answer number {i}', profile=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            Answer.objects.create(question=self.in_answer, text='One more decorator', profile=self.author)
+        self.assertEqual([
+            query['sql'] for query in queries
+            if '"app_answer"' in query['sql'] and not query['sql'].startswith('INSERT')
+        ], [])
+
+
+class FillDbTests(TestCase):
+    def test_reports_rows_created(self):
+        out = io.StringIO()
+        with mock.patch('sys.stdout', io.StringIO()):
+            call_command('fill_db', 1, '--skip-derived', stdout=out)
+        # 1 profile can cast only one vote per question/answer, the rest are capped away
+        self.assertEqual(QuestionVote.objects.count() + AnswerVote.objects.count(), 110)
+        self.assertIn('Successfully created 110 votes', out.getvalue())
+        self.assertIn('Successfully created 100 answers', out.getvalue())
+
+
+class BenchTests(TestCase):
+    @staticmethod
+    def result(status=200, queries=3, p50=2.0):
+        return {'status': status, 'queries': queries, 'p50_ms': p50, 'p95_ms': p50, 'peak_kb': 100.0}
+
+    def test_runs_every_view(self):
+        out = io.StringIO()
+        # bench seeds a throwaway database of its own, here the test database stands in for it
+        with mock.patch('app.management.commands.bench.setup_databases'), \
+                mock.patch('app.management.commands.bench.teardown_databases'):
+            call_command('bench', scales='1', iterations=1, warmup=0, stdout=out, stderr=io.StringIO())
+        results = json.loads(out.getvalue())['results']['1']
+
+        self.assertIn('?prefix=', results['suggest_tags']['path'])
+        self.assertEqual(results['suggest_tags']['status'], 200)
+        self.assertEqual(results['vote_question']['method'], 'POST')
+        self.assertEqual(results['index']['status'], 200)
+
+    def test_compare_flags_regressions(self):
+        from .management.commands.bench import Command
+
+        baseline = {'results': {'1': {'index': self.result(), 'tag': self.result(), 'hot': self.result()}}}
+        report = {'results': {'1': {
+            'index': self.result(queries=4),
+            'tag': self.result(status=500),
+            # latency within the tolerance and a view the baseline does not know are fine
+            'hot': self.result(p50=2.4),
+            'search': self.result(queries=50),
+        }}}
+
+        self.assertEqual(Command().compare(baseline, report, 0.25), [
+            'scale 1 index: queries 3 -> 4',
+            'scale 1 tag: status 200 -> 500',
+        ])
+        self.assertEqual(Command().compare(baseline, baseline, 0.25), [])
+
+
+@skipIf(connection.vendor != 'postgresql', '--workers needs PostgreSQL')
+class ForkedFillDbTests(TransactionTestCase):
+    def test_workers_with_pool(self):
+        self.assertTrue(settings.DB_POOL_ENABLED)
+        # the parent holds a pooled connection when the workers fork
+        self.assertFalse(Answer.objects.exists())
+        out = io.StringIO()
+        with mock.patch('sys.stdout', io.StringIO()):
+            call_command('fill_db', 1, '--workers', '2', '--batch-size', '20', '--skip-derived', stdout=out)
+        self.assertIn('Successfully created 100 answers', out.getvalue())
+        self.assertEqual(Answer.objects.count(), 100)
+        self.assertEqual(QuestionVote.objects.count() + AnswerVote.objects.count(), 110)
+
+
+class CardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = make_profile('author')
+        self.questions = [Question.objects.create(title=f'Q{i}?', text='...', profile=author) for i in range(5)]
+        for question in self.questions:
+            question.tags.add(Tag.objects.get_or_create(name='python')[0])
+
+    def cards(self):
+        return list(Question.objects.recent().for_cards())
+
+    def test_one_get_many_and_only_misses_rendered(self):
+        questions = self.cards()
+        with mock.patch('app.fragments.render_to_string', wraps=fragments.render_to_string) as render, \
+                mock.patch.object(fragments.cache, 'get_many', wraps=fragments.cache.get_many) as get_many, \
+                self.assertNumQueries(0):
+            cold = fragments.render_cards(questions)
+            warm = fragments.render_cards(questions)
+        self.assertEqual(get_many.call_count, 2)
+        self.assertEqual(render.call_count, len(questions))
+        self.assertEqual(cold, warm)
+        self.assertIn('Q4?', warm)
+
+    def test_version_bump_rerenders_one_card(self):
+        fragments.render_cards(self.cards())
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote('question', self.questions[2].pk, make_profile('voter').pk, 1)
+
+        with mock.patch('app.fragments.render_to_string', wraps=fragments.render_to_string) as render:
+            fragments.render_cards(self.cards())
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(render.call_args.args[1]['question'].pk, self.questions[2].pk)
+
+    def test_deleted_tag_leaves_the_cards(self):
+        self.assertIn('python', fragments.render_cards(self.cards()))
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.get(name='python').delete()
+
+        with mock.patch('app.fragments.render_to_string', wraps=fragments.render_to_string) as render:
+            html = fragments.render_cards(self.cards())
+        self.assertEqual(render.call_count, len(self.questions))
+        self.assertNotIn('python', html)
+
+    def test_relative_time_is_not_cached(self):
+        question = self.cards()[0]
+        self.assertIn('now', fragments.render_cards([question]))
+
+        question.created_at -= datetime.timedelta(minutes=5)
+        with mock.patch('app.fragments.render_to_string') as render:
+            html = fragments.render_cards([question])
+        render.assert_not_called()
+        self.assertIn('5\xa0minutes ago', html)
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_profile('author')
+        self.tag = Tag.objects.create(name='python')
+        self.question = Question.objects.create(title='How?', text='...', profile=self.author)
+        self.question.tags.add(self.tag)
+
+    def get(self, url):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(url)
+
+    def test_hit_does_not_touch_database(self):
+        for url in ['/', '/hot/', f'/tag/{self.tag.name}', f'/question/{self.question.id}']:
+            self.assertEqual(self.get(url)['X-Page-Cache'], 'miss')
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get(url)['X-Page-Cache'], 'hit')
+
+    def test_writes_purge_affected_pages(self):
+        other = Question.objects.create(title='Other?', text='...', profile=self.author)
+        for url in ['/', f'/question/{self.question.id}', f'/question/{other.id}']:
+            self.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            QuestionVote.objects.create(question=self.question, profile=self.author, value=1)
+
+        self.assertEqual(self.get('/')['X-Page-Cache'], 'miss')
+        self.assertEqual(self.get(f'/question/{self.question.id}')['X-Page-Cache'], 'miss')
+        self.assertEqual(self.get(f'/question/{other.id}')['X-Page-Cache'], 'hit')
+
+    def test_profile_changes_purge_pages_showing_it(self):
+        reader = make_profile('reader')
+        Answer.objects.create(question=self.question, text='...', profile=reader)
+        urls = ['/', '/hot/', f'/tag/{self.tag.name}', f'/question/{self.question.id}']
+        for url in urls:
+            self.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reader.nickname = 'renamed'
+            reader.save()
+        self.assertEqual(self.get('/')['X-Page-Cache'], 'hit')
+        self.assertContains(self.get(f'/question/{self.question.id}'), 'renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.avatar_url = 'https://example.com/new.png'
+            self.author.save()
+        for url in urls:
+            self.assertEqual(self.get(url)['X-Page-Cache'], 'miss', url)
+
+    def test_deleting_a_tag_purges_pages_showing_it(self):
+        empty = Tag.objects.create(name='rust')
+        urls = ['/', '/hot/', f'/question/{self.question.id}']
+        for url in urls + [f'/tag/{self.tag.name}', f'/tag/{empty.name}']:
+            self.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.delete()
+            # only its own page shows a tag without questions
+            empty.delete()
+        for url in urls:
+            self.assertEqual(self.get(url)['X-Page-Cache'], 'miss', url)
+        self.assertNotContains(self.get(f'/question/{self.question.id}'), '/tag/python')
+        self.assertEqual(self.get(f'/tag/{self.tag.name}').status_code, 404)
+        self.assertEqual(self.get(f'/tag/{empty.name}').status_code, 404)
+
+    def test_rebuilding_hot_scores_purges_the_hot_feed(self):
+        self.get('/hot/')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_hot_scores', stdout=io.StringIO())
+        self.assertEqual(self.get('/hot/')['X-Page-Cache'], 'miss')
+
+    def test_per_process_cache_is_flagged_for_deployment(self):
+        ids = [message.id for message in checks.run_checks(include_deployment_checks=True)]
+        self.assertIn('app.W001', ids)
+        with override_settings(CACHES={'default': settings.CACHE_BACKENDS['file']}):
+            ids = [message.id for message in checks.run_checks(include_deployment_checks=True)]
+        self.assertNotIn('app.W001', ids)
+
+    def test_logged_in_users_bypass_cache(self):
+        self.get('/')
+        self.client.force_login(self.author.user)
+        self.assertNotIn('X-Page-Cache', self.get('/'))
+
+
+class TagCounterTests(TestCase):
+    def setUp(self):
+        author = make_profile('author')
+        self.tags = [Tag.objects.create(name=f'tag{i}') for i in range(3)]
+        self.questions = [Question.objects.create(title=f'Q{i}?', text='...', profile=author) for i in range(3)]
+
+    def assertCounts(self, *counts):
+        self.assertEqual([tag.questions_count for tag in Tag.objects.order_by('name')], list(counts))
+
+    def test_counts_follow_links(self):
+        q0, q1, q2 = self.questions
+        t0, t1, t2 = self.tags
+        q0.tags.add(t0, t1)
+        q0.tags.add(t0)
+        t0.question_set.add(q1, q2)
+        self.assertCounts(3, 1, 0)
+
+        q0.tags.remove(t1, t2)
+        t0.question_set.remove(q2)
+        self.assertCounts(2, 0, 0)
+
+        q1.tags.set([t1, t2])
+        self.assertCounts(1, 1, 1)
+
+        t0.question_set.clear()
+        q1.delete()
+        self.assertCounts(0, 0, 0)
+
+    def test_rename_keeps_count(self):
+        tagindex.reset_index()
+        self.addCleanup(tagindex.reset_index)
+        tagindex.suggest('tag')
+        stale = Tag.objects.get(pk=self.tags[0].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[0].question_set.add(*self.questions[:2])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stale.name = 'renamed'
+            stale.save()
+        self.assertEqual(Tag.objects.get(pk=stale.pk).questions_count, 2)
+        self.assertEqual(tagindex.suggest('ren'), [('renamed', 2)])
+
+    def test_only_renames_touch_questions(self):
+        self.questions[0].tags.add(self.tags[0])
+        tag = Tag.objects.get(pk=self.tags[0].pk)
+        version = Question.objects.values_list('version', flat=True).get(pk=self.questions[0].pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            tag.save()
+        self.assertEqual([query['sql'] for query in queries if 'app_question' in query['sql']], [])
+
+        tag.name = 'renamed'
+        tag.save()
+        self.assertEqual(Question.objects.values_list('version', flat=True).get(pk=self.questions[0].pk), version + 1)
+        with self.assertNumQueries(1):
+            tag.save()
+
+    def test_sync_counters_agrees(self):
+        self.questions[0].tags.add(*self.tags)
+        self.tags[1].question_set.add(*self.questions)
+        expected = list(Tag.objects.order_by('name').values_list('questions_count', flat=True))
+
+        Tag.objects.update(questions_count=0)
+        call_command('sync_counters', stdout=io.StringIO())
+        self.assertCounts(*expected)
+
+
+class ProfileStatsTests(TestCase):
+    def setUp(self):
+        self.author = make_profile('author')
+        self.voter = make_profile('voter')
+        self.question = Question.objects.create(title='How?', text='...', profile=self.author)
+
+    def stats(self, profile):
+        return ProfileStats.objects.values_list(
+            'question_count', 'answer_count', 'accepted_answer_count', 'rating_received',
+        ).get(profile=profile)
+
+    def test_stats_follow_writes(self):
+        answer = Answer.objects.create(question=self.question, text='Like this', profile=self.voter)
+        QuestionVote.objects.create(question=self.question, profile=self.voter, value=1)
+        AnswerVote.objects.create(answer=answer, profile=self.author, value=-1)
+        answer.is_correct = True
+        answer.save()
+        self.assertEqual(self.stats(self.author), (1, 0, 0, 1))
+        self.assertEqual(self.stats(self.voter), (0, 1, 1, -1))
+
+        answer.delete()
+        self.assertEqual(self.stats(self.voter), (0, 0, 0, 0))
+        self.question.delete()
+        self.assertEqual(self.stats(self.author), (0, 0, 0, 0))
+
+    def test_sync_counters_agrees(self):
+        answer = Answer.objects.create(question=self.question, text='Like this', profile=self.voter, is_correct=True)
+        AnswerVote.objects.create(answer=answer, profile=self.author, value=1)
+        expected = [self.stats(self.author), self.stats(self.voter)]
+
+        ProfileStats.objects.all().delete()
+        call_command('sync_counters', stdout=io.StringIO())
+        self.assertEqual([self.stats(self.author), self.stats(self.voter)], expected)
+
+
+@override_settings(REQUEST_PROFILING_SAMPLE_RATE=1, REQUEST_PROFILING_REPEAT_THRESHOLD=3)
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = make_profile('author')
+        self.questions = [Question.objects.create(title=f'Q{i}?', text='...', profile=author) for i in range(3)]
+
+    def test_server_timing_and_log(self):
+        with self.assertLogs('app.profiling', 'INFO') as logs:
+            response = self.client.get(f'/question/{self.questions[0].id}')
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], f'/question/{self.questions[0].id}')
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertLessEqual(len(record['slowest']), 3)
+
+    def test_repeated_queries_are_flagged(self):
+        profile = RequestProfile()
+        with connection.execute_wrapper(profile):
+            for question in self.questions:
+                Question.objects.get(pk=question.pk)
+            Question.objects.filter(pk__in=[1, 2]).count()
+            Question.objects.filter(pk__in=[1, 2, 3]).count()
+
+        ((shape, count),) = profile.repeated(3)
+        self.assertEqual(count, 3)
+        self.assertIn('WHERE', shape)
+        self.assertEqual(profile.repeated(2)[1][1], 2)
+
+
+class EventHubTests(TestCase):
+    async def test_fan_out_and_eviction(self):
+        hub = events.EventHub()
+        with override_settings(EVENTS_QUEUE_SIZE=2):
+            fast, slow = hub.subscribe('question:1'), hub.subscribe('question:1')
+        other = hub.subscribe('question:2')
+
+        frame = events.sse_frame('answer', {'id': 1})
+        hub.deliver('question:1', frame)
+        self.assertIs(await fast.queue.get(), frame)
+        self.assertTrue(other.queue.empty())
+
+        # `slow` never reads: the third event doesn't fit and it is dropped
+        hub.deliver('question:1', frame)
+        hub.deliver('question:1', frame)
+        self.assertEqual(hub.evictions, 1)
+        self.assertIs(await slow.queue.get(), events.EVICTED)
+        self.assertEqual(hub.subscriber_count(), 2)
+
+    def test_idle_stream_memory_and_cleanup(self):
+        out = io.StringIO()
+        call_command('bench_events', subscribers=1000, topics=10, stdout=out)
+        output = out.getvalue()
+
+        per_stream = float(re.search(r'([\d.]+) KB per stream', output)[1])
+        total = float(re.search(r'([\d.]+) MB in total', output)[1]) * 1024
+        retained = float(re.search(r'([\d.]+) KB retained', output)[1])
+        self.assertLess(per_stream, 8)
+        # what stays is the event loop's task bookkeeping, not the streams
+        self.assertLess(retained, total / 10)
+        self.assertIn('after disconnect: 0 subscribers', output)
+        self.assertEqual(events.hub.topics, {})
+
+
+@override_settings(ROOT_URLCONF='qna_project.urls_async', EVENTS_BACKEND='app.events.LocalBackend')
+class LiveEventsTests(TransactionTestCase):
+    databases = '__all__'
+
+    @classmethod
+    def tearDownClass(cls):
+        close_replica_pools()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_profile('author')
+        self.question = Question.objects.create(title='Live?', text='...', profile=self.author)
+
+    async def test_stream(self):
+        response = await self.async_client.get(f'/question/{self.question.id}/events')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+
+        answer = await Answer.objects.acreate(question=self.question, text='Now', profile=self.author)
+        frame = await asyncio.wait_for(anext(stream), 5)
+        self.assertEqual(frame, f'event: answer\ndata: {{"id":{answer.pk}}}\n\n'.encode())
+
+        await sync_to_async(cast_vote)('answer', answer.pk, self.author.pk, 1)
+        frame = await asyncio.wait_for(anext(stream), 5)
+        self.assertIn(b'event: rating', frame)
+        self.assertIn(b'"rating":1', frame)
+
+        # a client disconnect cancels the task that is waiting for the next event
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(events.hub.subscriber_count(), 0)
+
+    async def test_unread_stream_holds_no_subscription(self):
+        response = await self.async_client.get(f'/question/{self.question.id}/events')
+        self.assertEqual(response.status_code, 200)
+        # never iterated, e.g. the client went away before the first frame
+        self.assertEqual(events.hub.subscriber_count(), 0)
+        await response.streaming_content.aclose()
+        self.assertEqual(events.hub.subscriber_count(), 0)
+
+    async def test_page_links_the_stream(self):
+        response = await self.async_client.get(f'/question/{self.question.id}')
+        self.assertContains(response, f'data-events-url="/question/{self.question.id}/events"')
+        with override_settings(ROOT_URLCONF='qna_project.urls'):
+            response = await self.async_client.get(f'/question/{self.question.id}')
+        self.assertContains(response, 'Live?')
+        self.assertNotContains(response, 'data-events-url')
+        self.assertEqual((await self.async_client.get('/question/0/events')).status_code, 404)
+
+
+class QuestionPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = make_profile('author')
+        self.question = Question.objects.create(title='How?', text='...', profile=author)
+        self.question.tags.add(Tag.objects.create(name='python'))
+        self.answers = [
+            Answer.objects.create(question=self.question, text=f'Answer {i}', profile=make_profile(f'user{i}'))
+            for i in range(ANSWERS_PER_PAGE + 5)
+        ]
+        Answer.objects.filter(pk=self.answers[3].pk).update(rating=10)
+        Answer.objects.filter(pk=self.answers[7].pk).update(is_correct=True)
+
+    def test_accepted_then_rated_first(self):
+        response = self.client.get(f'/question/{self.question.id}')
+        answers = response.context['answers']
+        self.assertEqual(len(answers), ANSWERS_PER_PAGE)
+        self.assertEqual([answer.pk for answer in answers[:3]],
+                         [self.answers[7].pk, self.answers[3].pk, self.answers[0].pk])
+        self.assertContains(response, reverse('profile', args=['user7']))
+
+        rest = self.client.get(f'/question/{self.question.id}?' + response.context['page'].next_query)
+        self.assertEqual(len(rest.context['answers']), 5)
+        seen = {answer.pk for answer in answers} | {answer.pk for answer in rest.context['answers']}
+        self.assertEqual(len(seen), len(self.answers))
+
+    def test_queries_do_not_grow_with_answers(self):
+        # question with its author, its tags, one page of answers with their authors
+        with self.assertNumQueries(3):
+            self.client.get(f'/question/{self.question.id}')
+
+        author = make_profile('late')
+        for i in range(30):
+            Answer.objects.create(question=self.question, text='...', profile=author)
+        cache.clear()
+        with self.assertNumQueries(3):
+            self.client.get(f'/question/{self.question.id}')
+
+
+class TagSuggestTests(TestCase):
+    def setUp(self):
+        tagindex.reset_index()
+        self.addCleanup(tagindex.reset_index)
+        author = make_profile('author')
+        self.tags = {name: Tag.objects.create(name=name) for name in ['python', 'Pytest', 'pyramid', 'rust']}
+        for i, names in enumerate([['python', 'pyramid'], ['python'], ['Pytest']]):
+            question = Question.objects.create(title=f'Q{i}?', text='...', profile=author)
+            question.tags.add(*[self.tags[name] for name in names])
+
+    def suggest(self, prefix, **params):
+        response = self.client.get(reverse('suggest_tags'), {'prefix': prefix, **params})
+        return [(tag['name'], tag['questions_count']) for tag in response.json()['tags']]
+
+    def test_most_used_first(self):
+        self.assertEqual(self.suggest('PY'), [('python', 2), ('Pytest', 1), ('pyramid', 1)])
+        self.assertEqual(self.suggest('py', limit=1), [('python', 2)])
+        self.assertEqual(self.suggest('x'), [])
+        self.assertEqual(self.client.get(reverse('suggest_tags'), {'prefix': 'py', 'limit': 500}).status_code, 400)
+
+    def test_index_follows_changes(self):
+        self.suggest('py')
+        author = Profile.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(2):
+                Question.objects.create(title='More?', text='...', profile=author).tags.add(self.tags['pyramid'])
+            Tag.objects.create(name='pydantic')
+            self.tags['rust'].name = 'pyo3'
+            self.tags['rust'].save()
+            self.tags['Pytest'].delete()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('py'), [('pyramid', 3), ('python', 2), ('pydantic', 0), ('pyo3', 0)])
+
+    def test_blocks_split_and_merge(self):
+        rng = random.Random(0)
+        index = tagindex.TagIndex([])
+        expected = {}
+        for pk in range(tagindex.BLOCK_SIZE * 5):
+            name = ''.join(rng.choices('abc', k=6)) + str(pk)
+            count = rng.randint(0, 50)
+            index.add(pk, name, count)
+            expected[pk] = (name, count)
+        split = len(index.blocks)
+        self.assertGreater(split, 2)
+
+        # removing most tags merges the blocks that shrink below half their size
+        for step in (3, 2, 5):
+            for pk in list(expected)[::step]:
+                index.remove(pk)
+                del expected[pk]
+            self.assertTrue(all(
+                tagindex.BLOCK_SIZE // 2 <= len(block.keys) <= 2 * tagindex.BLOCK_SIZE for block in index.blocks
+            ))
+            for prefix in ['a', 'ab', 'cab', 'b1']:
+                matches = sorted((-count, name) for name, count in expected.values() if name.startswith(prefix))
+                self.assertEqual(index.suggest(prefix, 15), [(name, -count) for count, name in matches[:15]])
+        self.assertLess(len(index.blocks), split)
+
+
+class TagFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = make_profile('author')
+        self.tags = {name: Tag.objects.create(name=name) for name in ['python', 'django', 'java', 'c++', 'scikit-learn', 'scikit']}
+        self.questions = {}
+        for title, names in [
+            ('web', ['python', 'django']),
+            ('jvm', ['python', 'django', 'java']),
+            ('ml', ['python', 'scikit-learn']),
+            ('old', ['python', 'scikit']),
+            ('native', ['c++']),
+        ]:
+            self.questions[title] = Question.objects.create(title=title, text='...', profile=author)
+            self.questions[title].tags.add(*[self.tags[name] for name in names])
+
+    def feed(self, expression):
+        response = self.client.get(f'/tag/{expression}')
+        self.assertEqual(response.status_code, 200)
+        return sorted(question.title for question in response.context['questions'])
+
+    def test_intersection_and_exclusion(self):
+        self.assertEqual(self.feed('python'), ['jvm', 'ml', 'old', 'web'])
+        self.assertEqual(self.feed('python+django'), ['jvm', 'web'])
+        self.assertEqual(self.feed('django+python+python'), ['jvm', 'web'])
+        self.assertEqual(self.feed('python+django-java'), ['web'])
+        self.assertEqual(self.feed('python-django-scikit'), ['ml'])
+
+    def test_names_with_operators(self):
+        self.assertEqual(self.feed('scikit-learn'), ['ml'])
+        self.assertEqual(self.feed('python-scikit-learn'), ['jvm', 'old', 'web'])
+        self.assertEqual(self.feed('c++'), ['native'])
+
+    def test_unknown_tags(self):
+        for expression in ['rust', 'python+rust', '-python', 'python+', 'python++django']:
+            self.assertEqual(self.client.get(f'/tag/{expression}').status_code, 404, expression)
+
+    def test_queries_do_not_grow_with_tags(self):
+        # sidebar (2), the named tags, one page of questions with their authors, their tags
+        for expression in ['python', 'python+django-java', 'python+django-scikit-learn-c++']:
+            cache.clear()
+            with self.assertNumQueries(5):
+                self.client.get(f'/tag/{expression}')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_profile('author')
+        self.question = Question.objects.create(title='How?', text='...', profile=self.author)
+        self.question.tags.add(Tag.objects.create(name='python'))
+        Answer.objects.create(question=self.question, text='Like this', profile=self.author)
+        self.urls = ['/', '/tag/python', f'/question/{self.question.id}']
+
+    def test_anonymous_revalidation(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn('no-cache', response['Cache-Control'])
+            # served from the page cache, or checked against the validators if it was evicted
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304, url)
+            cache.delete(AnonymousPageCacheMiddleware(None).page_key(RequestFactory().get(url)))
+            with self.assertNumQueries(0):
+                revalidated = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(revalidated.status_code, 304, url)
+            self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_logged_in_revalidation(self):
+        self.client.force_login(self.author.user)
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            # the session
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304, url)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"other"').status_code, 200, url)
+
+        # another user's copy is never current
+        self.client.force_login(make_profile('reader').user)
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_changes_invalidate(self):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        with self.captureOnCommitCallbacks(execute=True):
+            Answer.objects.create(question=self.question, text='Or this', profile=make_profile('late'))
+            cast_vote('question', self.question.pk, self.author.pk, 1)
+
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag)
+
+
+class DbPoolViewTests(TestCase):
+    def test_staff_only(self):
+        self.assertEqual(self.client.get(reverse('db_pool')).status_code, 302)
+
+        profile = make_profile('admin')
+        profile.user.is_staff = True
+        profile.user.save()
+        self.client.force_login(profile.user)
+        pools = self.client.get(reverse('db_pool')).json()['pools']
+        self.assertIn('default', pools)
+        if pools['default'] is not None:
+            self.assertIn('utilization', pools['default'])
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # decorated views only use replicas outside of a transaction
+    databases = '__all__'
+
+    @classmethod
+    def tearDownClass(cls):
+        close_replica_pools()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+        @replica_reads
+        def view(request):
+            return self.router.db_for_read(Question), self.router.db_for_write(Question)
+        self.view = view
+
+    @override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], REPLICA_SELECTION='round_robin')
+    def test_round_robin(self):
+        self.assertEqual({select_replica() for _ in range(4)}, {'replica1', 'replica2'})
+
+    @override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], REPLICA_SELECTION='least_latency')
+    def test_least_latency(self):
+        with mock.patch.dict('app.routers._latency', {'replica1': 0.004, 'replica2': 0.001}), \
+                mock.patch('app.routers.random.random', return_value=0.5):
+            self.assertEqual(select_replica(), 'replica2')
+            record_latency('replica2', 0.1)
+            self.assertEqual(select_replica(), 'replica1')
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_only_decorated_views_read_from_replicas(self):
+        request = RequestFactory().get('/')
+        self.assertEqual(self.router.db_for_read(Question), 'default')
+        self.assertEqual(self.view(request), ('replica1', 'default'))
+
+        request.COOKIES[PIN_COOKIE] = str(time.time() + 5)
+        self.assertEqual(self.view(request), ('default', 'default'))
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_writes_pin_the_client_to_the_primary(self):
+        author = make_profile('author')
+        question = Question.objects.create(title='How?', text='...', profile=author)
+        self.client.force_login(author.user)
+
+        self.assertNotIn(PIN_COOKIE, self.client.get('/login/').cookies)
+        response = self.client.post(reverse('vote_question', args=[question.id]), {'value': 1})
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    @skipUnless(settings.DATABASE_REPLICAS, 'set QNA_DB_REPLICAS to run the pages against replica aliases')
+    def test_pages_with_replicas(self):
+        author = make_profile('author')
+        question = Question.objects.create(title='Replicated?', text='...', profile=author)
+        for url in ['/', '/hot/', f'/question/{question.id}']:
+            self.assertContains(self.client.get(url), 'Replicated?')
+
+
+class AvatarThumbnailTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, color='red', size=(600, 400)):
+        output = io.BytesIO()
+        Image.new('RGB', size, color).save(output, 'PNG')
+        return SimpleUploadedFile('photo.png', output.getvalue(), content_type='image/png')
+
+    def test_variants_on_upload(self):
+        profile = make_profile('author')
+        self.assertEqual(profile.avatar, '../static/img/avatar_default.svg')
+
+        profile.avatar_image = self.upload()
+        profile.save()
+        name = Profile.objects.get(pk=profile.pk).avatar_thumbnail
+        self.assertTrue(name)
+        for size in AVATAR_SIZES:
+            with default_storage.open(thumbnail_path(name, size)) as f, Image.open(f) as image:
+                self.assertEqual(image.size, (size, size))
+        self.assertTrue(profile.avatar.endswith(f'/64/{name}'))
+        self.assertTrue(profile.avatar_2x.endswith(f'/128/{name}'))
+
+        # same content, same files; a new picture gets new names
+        other = make_profile('other')
+        other.avatar_image = self.upload()
+        other.save()
+        self.assertEqual(other.avatar_thumbnail, name)
+        other.avatar_image = self.upload('blue')
+        other.save()
+        self.assertNotEqual(other.avatar_thumbnail, name)
+
+    def test_unreadable_image_falls_back_to_the_original(self):
+        profile = make_profile('author')
+        profile.avatar_image = SimpleUploadedFile('photo.png', b'not an image')
+        profile.save()
+        self.assertEqual(profile.avatar_thumbnail, '')
+        self.assertEqual(profile.avatar, profile.avatar_image.url)
+
+    def test_backfill(self):
+        profile = make_profile('author')
+        profile.avatar_image = self.upload()
+        profile.save()
+        Profile.objects.filter(pk=profile.pk).update(avatar_thumbnail='')
+
+        out = io.StringIO()
+        call_command('build_avatars', stdout=out)
+        self.assertIn('Resized 1 avatars', out.getvalue())
+        self.assertTrue(Profile.objects.get(pk=profile.pk).avatar_thumbnail)
+
+
+    def test_variants_cached_forever(self):
+        profile = make_profile('author')
+        profile.avatar_image = self.upload()
+        profile.save()
+
+        response = self.client.get(profile.avatar)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (64, 64))
+
+        self.assertEqual(self.client.get(profile.avatar.replace('/64/', '/32/')).status_code, 404)
+        self.assertEqual(self.client.get(reverse('avatar_thumbnail', args=[64, '..'])).status_code, 404)
+
+class StaticAssetTests(TestCase):
+    def setUp(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        override = override_settings(STATIC_ROOT=static_root, DEBUG=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_fingerprinted_and_precompressed(self):
+        url = static('bootstrap/css/bootstrap.min.css')
+        self.assertRegex(url, r'^/static/bootstrap/css/bootstrap\.min\.[0-9a-f]{12}\.css$')
+
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        body = gzip.decompress(b''.join(response.streaming_content))
+        with staticfiles_storage.open(url.removeprefix('/static/')) as f:
+            self.assertEqual(body, f.read())
+
+        # refused encodings get the identity file, with a different ETag
+        plain = self.client.get(url, headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertNotEqual(plain['ETag'], response['ETag'])
+
+    def test_revalidation(self):
+        response = self.client.get('/static/js/votes.js')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=0, must-revalidate')
+
+        response = self.client.get('/static/js/votes.js', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every feed query on a seeded dataset and fail on a full table scan.
+    On PostgreSQL sequential scans are disabled so that the planner only falls
+    back to one when no index can serve the query.
+    """
+    QUESTIONS = 300
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        profiles = [make_profile(f'user{i}') for i in range(20)]
+        tags = Tag.objects.bulk_create(Tag(name=f'tag{i}') for i in range(30))
+        questions = Question.objects.bulk_create(
+            Question(title=f'Question {i}?', text='...', profile=rng.choice(profiles))
+            for i in range(cls.QUESTIONS)
+        )
+        Question.tags.through.objects.bulk_create(
+            Question.tags.through(question_id=question.pk, tag_id=tag.pk)
+            for question in questions
+            for tag in rng.sample(tags, 3)
+        )
+        QuestionVote.objects.bulk_create(
+            QuestionVote(question=question, profile=profile, value=rng.choice([-1, 1]))
+            for question in questions
+            for profile in rng.sample(profiles, 5)
+        )
+        Answer.objects.bulk_create(
+            Answer(question=question, text='...', profile=rng.choice(profiles), is_correct=i == 0)
+            for question in questions[:50]
+            for i in range(rng.randint(0, 6))
+        )
+        # bulk inserts skip the signals that maintain the counters
+        call_command('sync_counters', stdout=io.StringIO())
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def full_scans(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            return re.findall(r'Seq Scan on (app_\w+)', plan)
+        # SQLite: "SCAN app_question" is a full scan, "SCAN app_question USING INDEX ..." is not
+        return re.findall(r'\bSCAN (app_\w+)\b(?! USING)', plan)
+
+    def assertUsesIndexes(self, queryset):
+        self.assertEqual(self.full_scans(queryset), [], queryset.explain())
+
+    def test_recent(self):
+        self.assertUsesIndexes(Question.objects.recent()[:10])
+
+    def test_by_tag(self):
+        self.assertUsesIndexes(Question.objects.by_tag('tag3')[:10])
+
+    def test_tagged(self):
+        tags = list(Tag.objects.values_list('pk', flat=True)[:4])
+        self.assertUsesIndexes(Question.objects.tagged(tags[:2], tags[2:]).order_by('-created_at', '-id')[:10])
+
+    def test_most_upvoted(self):
+        self.assertUsesIndexes(Question.objects.most_upvoted()[:10])
+
+    def test_most_popular(self):
+        self.assertUsesIndexes(Tag.objects.most_popular()[:7])
+
+    def test_most_active(self):
+        self.assertUsesIndexes(Profile.objects.most_active()[:7])
+
+    def test_vote_sum(self):
+        question = Question.objects.first()
+        self.assertUsesIndexes(QuestionVote.objects.filter(question=question).values('value'))
+
+    def test_answer_thread(self):
+        question = Question.objects.first()
+        self.assertUsesIndexes(Answer.objects.for_thread(question.pk)[:20])
@@ -1,36 +1,67 @@
+import os
+
 from django.shortcuts import render
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
-from django.http import HttpResponseNotFound
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponseNotFound, JsonResponse
+from django.views.decorators.http import require_POST
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
-from .models import Question, Tag, Profile, Answer
+from django.urls import NoReverseMatch, reverse
+from . import avatars, tagindex
+from .conditional import conditional_page
+from .dbpool import pool_stats
+from .models import Question, Profile, Answer
+from .pagination import CursorPaginator, InvalidCursor
+from .routers import replica_reads
+from .search import search_questions
+from .sidebar import get_sidebar
+from .staticfiles import IMMUTABLE
+from .surrogates import add_surrogate_keys, question_keys, thread_keys
+from .tagfilter import parse_tags
+from .votes import cast_vote, VoteTargetMissing
 
+# a thread's page costs the same however many answers it has
+ANSWERS_PER_PAGE = 20
 
-def paginate(request, obj_list, per_page=10):
-    try:
-        page_num = int(request.GET.get('page', 1))
-    except (ValueError, TypeError):
-        page_num = 1
-        
-    paginator = Paginator(obj_list, per_page)
+
+def paginate(request, queryset, per_page=10, count=None):
+    paginator = CursorPaginator(queryset, per_page=per_page, count=count)
     
     try:
-        page = paginator.page(page_num)
-    except PageNotAnInteger:
-        page = paginator.page(1)
-    except EmptyPage:
-        page = paginator.page(paginator.num_pages)
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        page = paginator.page()
+    
+    params = request.GET.copy()
+    if page.has_next():
+        params['cursor'] = page.next_cursor
+        page.next_query = params.urlencode()
+    if page.has_previous():
+        params['cursor'] = page.previous_cursor
+        page.previous_query = params.urlencode()
     
     return page
 
+def events_url(question_id):
+    # only the ASGI URLconf (qna_project.urls_async) serves the live stream
+    try:
+        return reverse('question_events', args=[question_id])
+    except NoReverseMatch:
+        return None
+
 def left_bar_data():
-    return Tag.objects.most_popular()[:7], Profile.objects.most_active()[:7]
+    sidebar = get_sidebar()
+    return sidebar['tags'], sidebar['profiles']
 
+@conditional_page
+@replica_reads
 def index(request):
     left_bar_tags, left_bar_profiles = left_bar_data()
     
-    questions = Question.objects.recent()
+    questions = Question.objects.recent().for_cards()
     
     page = paginate(request, questions)
+    add_surrogate_keys(request, 'feed:index', *question_keys(page))
     
     return render(request, 'index.html', context={
         'questions': page.object_list,
@@ -39,12 +70,15 @@ def index(request):
         'left_bar_profiles': left_bar_profiles 
     })
     
+@conditional_page
+@replica_reads
 def hot(request):
     left_bar_tags, left_bar_profiles = left_bar_data()
     
-    questions = Question.objects.most_upvoted()
+    questions = Question.objects.most_upvoted().for_cards()
     
     page = paginate(request, questions)
+    add_surrogate_keys(request, 'feed:hot', *question_keys(page))
     
     return render(request, 'hot.html', context={
         'questions': page.object_list,
@@ -62,35 +96,62 @@ def login(request):
 def register(request):
     return render(request, 'register.html')
 
+@conditional_page
+@replica_reads
 def question(request, question_id):
-    try:
-        question = Question.objects.get(id=question_id)
-    except Question.DoesNotExist:
+    question = Question.objects.filter(id=question_id).for_cards().first()
+    if question is None:
         return HttpResponseNotFound('<h1>Question not found</h1>')
     
+    page = paginate(request, Answer.objects.for_thread(question.pk), per_page=ANSWERS_PER_PAGE)
+    add_surrogate_keys(request, *thread_keys(question, page))
+    
     return render(request, 'question.html', context={
         'question': question,
+        'answers': page.object_list,
+        'page': page,
+        'events_url': events_url(question.pk),
     })
     
 def ask(request):
     return render(request, 'ask.html')
 
+@conditional_page
+@replica_reads
 def tag(request, tag):
     left_bar_tags, left_bar_profiles = left_bar_data()
     
-    try:
-        tag = Tag.objects.get(name=tag)
-    except Tag.DoesNotExist:
+    tags = parse_tags(tag)
+    if tags is None:
         return HttpResponseNotFound('<h1>Tag not found</h1>')
+    include, exclude = tags
     
-    questions = Question.objects.by_tag(tag)
+    questions = Question.objects.tagged([t.pk for t in include], [t.pk for t in exclude]).for_cards()
     
     page = paginate(request, questions)
+    add_surrogate_keys(request, *[f'tag:{t.pk}' for t in include + exclude], *question_keys(page))
     
     return render(request, 'tag_results.html', context={
         'page': page,
         'questions': page.object_list,
-        'tag_name': tag,
+        'tag_name': ' + '.join(t.name for t in include),
+        'excluded_tags': exclude,
+        'left_bar_tags': left_bar_tags,
+        'left_bar_profiles': left_bar_profiles 
+    })
+    
+def search(request):
+    left_bar_tags, left_bar_profiles = left_bar_data()
+    
+    query = request.GET.get('q', '').strip()
+    questions = search_questions(query).for_cards() if query else Question.objects.none()
+    
+    page = paginate(request, questions)
+    
+    return render(request, 'search_results.html', context={
+        'page': page,
+        'questions': page.object_list,
+        'query': query,
         'left_bar_tags': left_bar_tags,
         'left_bar_profiles': left_bar_profiles 
     })
@@ -100,3 +161,67 @@ def register(request):
 
 def profile(request):
     pass
+
+def vote(request, kind, target_id):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'login required'}, status=401)
+    
+    try:
+        value = int(request.POST.get('value', ''))
+    except ValueError:
+        value = None
+    if value not in (1, 0, -1):
+        return JsonResponse({'error': 'value must be 1, -1 or 0'}, status=400)
+    
+    profile_id = Profile.objects.filter(user=request.user).values_list('id', flat=True).first()
+    if profile_id is None:
+        return JsonResponse({'error': 'profile required'}, status=403)
+    
+    try:
+        rating = cast_vote(kind, target_id, profile_id, value)
+    except VoteTargetMissing:
+        return JsonResponse({'error': f'{kind} not found'}, status=404)
+    
+    return JsonResponse({'rating': rating, 'value': value})
+
+@require_POST
+def vote_question(request, question_id):
+    return vote(request, 'question', question_id)
+
+@require_POST
+def vote_answer(request, answer_id):
+    return vote(request, 'answer', answer_id)
+
+@staff_member_required
+def db_pool(request):
+    # stats of the worker process that happened to serve this request
+    return JsonResponse({'pid': os.getpid(), 'pools': pool_stats()})
+
+def suggest_tags(request):
+    prefix = request.GET.get('prefix', '').strip()
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = None
+    if limit is None or not 1 <= limit <= tagindex.MAX_LIMIT:
+        return JsonResponse({'error': f'limit must be between 1 and {tagindex.MAX_LIMIT}'}, status=400)
+    
+    tags = tagindex.suggest(prefix, limit) if prefix else []
+    response = JsonResponse({
+        'prefix': prefix,
+        'tags': [{'name': name, 'questions_count': count} for name, count in tags],
+    })
+    # the same prefix is typed again and again, counts may lag a little
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+def avatar_thumbnail(request, size, name):
+    # names are content hashes (see app.avatars), so a URL is never reused for another picture
+    path = avatars.thumbnail_path(name, size)
+    if size not in avatars.AVATAR_SIZES or not avatars.NAME_PATTERN.fullmatch(name) \
+            or not default_storage.exists(path):
+        return HttpResponseNotFound()
+    
+    response = FileResponse(default_storage.open(path), content_type=f'image/{name.rsplit(".", 1)[1]}')
+    response['Cache-Control'] = IMMUTABLE
+    return response
@@ -0,0 +1,132 @@
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+
+from .events import publish, topic_for
+from .models import Question, Answer, QuestionVote, AnswerVote
+from .ranking import hot_score_change
+from .stats import author_of, change_profile_stats
+from .surrogates import purge
+
+
+class VoteTargetMissing(Exception):
+    pass
+
+
+def _update_returning(queryset, returning, **values):
+    """queryset.update(**values) that returns the `returning` columns of the updated row, None if there's none."""
+    query = queryset.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    sql, params = query.get_compiler(queryset.db).as_sql()
+    columns = ', '.join(connection.ops.quote_name(queryset.model._meta.get_field(name).column) for name in returning)
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} RETURNING {columns}', params)
+        return cursor.fetchone()
+
+
+def change_question_rating(question_id, delta):
+    """
+    Applies a nonzero rating delta to a question; returns (rating, question id), None if it's gone.
+    The author's stats are updated first, so the question row, the hot one, is locked last.
+    """
+    change_profile_stats(author_of(Question, question_id), rating_received=delta)
+    row = _update_returning(
+        Question.objects.filter(pk=question_id), ['rating', 'id'],
+        rating=F('rating') + delta,
+        version=F('version') + 1,
+        hot_score=hot_score_change(rating=delta),
+    )
+    if row is not None:
+        purge(f'question:{question_id}', 'feed:hot')
+    return row
+
+
+def change_answer_rating(answer_id, delta):
+    change_profile_stats(author_of(Answer, answer_id), rating_received=delta)
+    row = _update_returning(Answer.objects.filter(pk=answer_id), ['rating', 'question'], rating=F('rating') + delta)
+    if row is not None:
+        purge(f'answer:{answer_id}')
+    return row
+
+
+VOTE_TARGETS = {
+    'question': (QuestionVote, Question, change_question_rating),
+    'answer': (AnswerVote, Answer, change_answer_rating),
+}
+
+
+def _upsert(vote_model, target_column, target_id, profile_id, value):
+    """
+    Inserts or flips a vote in one statement and returns the rating delta.
+
+    ON CONFLICT serializes concurrent votes of the same profile on the unique index
+    and leaves unchanged votes alone. Since votes are +1/-1, a returned row is
+    either a new vote (created_at = updated_at, delta = value) or a flipped one
+    (delta = 2 * value); no row means the vote didn't change.
+    """
+    table = connection.ops.quote_name(vote_model._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({target_column}, profile_id, value, created_at, updated_at) '
+            f'VALUES (%s, %s, %s, %s, %s) '
+            f'ON CONFLICT ({target_column}, profile_id) DO UPDATE '
+            f'SET value = excluded.value, updated_at = excluded.updated_at '
+            f'WHERE {table}.value <> excluded.value '
+            f'RETURNING created_at = updated_at',
+            [target_id, profile_id, value, now, now],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return 0
+    return value if row[0] else 2 * value
+
+
+def _retract(vote_model, target_column, target_id, profile_id):
+    table = connection.ops.quote_name(vote_model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {target_column} = %s AND profile_id = %s RETURNING value',
+            [target_id, profile_id],
+        )
+        row = cursor.fetchone()
+    return -row[0] if row else 0
+
+
+def cast_vote(kind, target_id, profile_id, value):
+    """
+    Sets the profile's vote on a question or an answer to value (1, -1, or 0 to retract)
+    and returns the target's new rating.
+
+    The vote row is written first, then the author's stats and the target's rating
+    last: the hot row of a popular question is locked by one UPDATE ... RETURNING
+    and held until the commit. A vote that changes nothing writes nothing else.
+
+    Every write that locks more than one of these rows takes them in the same order,
+    ProfileStats, then the answer, then the question (app.signals updates the stats
+    in pre_save/pre_delete for that); an answer locking its question before its
+    author's stats could deadlock with a vote on that question.
+    """
+    vote_model, target_model, change_rating = VOTE_TARGETS[kind]
+    target_column = vote_model._meta.get_field(kind).column
+
+    with transaction.atomic():
+        if value:
+            delta = _upsert(vote_model, target_column, target_id, profile_id, value)
+        else:
+            delta = _retract(vote_model, target_column, target_id, profile_id)
+
+        if not delta:
+            # a plain read, also checks that the target exists
+            rating = target_model.objects.filter(pk=target_id).values_list('rating', flat=True).first()
+            if rating is None:
+                raise VoteTargetMissing(target_id)
+            return rating
+
+        row = change_rating(target_id, delta)
+        if row is None:
+            raise VoteTargetMissing(target_id)
+        rating, question_id = row
+        publish(topic_for(question_id), 'rating', {'kind': kind, 'id': target_id, 'rating': rating})
+        return rating
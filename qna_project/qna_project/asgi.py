@@ -3,6 +3,13 @@ ASGI config for qna_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server, e.g.
+
+    uvicorn qna_project.asgi:application --workers 4
+
+It serves the same synchronous views as WSGI; QNA_ROOT_URLCONF=qna_project.urls_async
+adds the live question page streams (app.events), the only async views.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
@@ -11,9 +11,14 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 from pathlib import Path
-from config.postgres_credentials import *
 import os
 
+try:
+    from config.postgres_credentials import *
+except ImportError:
+    # everything can come from QNA_DB_* environment variables instead, see db_setting()
+    pass
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,7 +49,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.middleware.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'app.middleware.StaticAssetMiddleware',
+    'app.middleware.AnonymousPageCacheMiddleware',
+    'app.routers.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -53,7 +62,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'qna_project.urls'
+# QNA_ROOT_URLCONF=qna_project.urls_async adds the live question page streams (ASGI only, see asgi.py)
+ROOT_URLCONF = os.environ.get('QNA_ROOT_URLCONF', 'qna_project.urls')
 
 TEMPLATES = [
     {
@@ -77,15 +87,149 @@ WSGI_APPLICATION = 'qna_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+def db_setting(name, default=None, cast=str):
+    """QNA_<name> from the environment, else <name> from config/postgres_credentials.py, else default."""
+    value = os.environ.get(f'QNA_{name}', globals().get(name, default))
+    return cast(value) if value is not None else None
+
+
+def as_bool(value):
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+# psycopg 3 connection pool, one per process; with DB_POOL off connections
+# persist for DB_CONN_MAX_AGE seconds instead (pooling needs CONN_MAX_AGE = 0)
+DB_POOL_ENABLED = db_setting('DB_POOL', True, as_bool)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': DB_NAME,
-        'USER': DB_USER,
-        'PASSWORD': DB_PASSWORD,
-        'HOST': DB_HOST,
-        'PORT': DB_PORT,
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': db_setting('DB_NAME'),
+        'USER': db_setting('DB_USER'),
+        'PASSWORD': db_setting('DB_PASSWORD'),
+        'HOST': db_setting('DB_HOST'),
+        'PORT': db_setting('DB_PORT'),
+        'CONN_MAX_AGE': 0 if DB_POOL_ENABLED else db_setting('DB_CONN_MAX_AGE', 60, int),
+        # pooled connections are checked when they are handed out, persistent ones per request
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': db_setting('DB_POOL_MIN_SIZE', 2, int),
+                'max_size': db_setting('DB_POOL_MAX_SIZE', 10, int),
+                # seconds to wait for a free connection before failing the request
+                'timeout': db_setting('DB_POOL_TIMEOUT', 10, float),
+                'max_idle': db_setting('DB_POOL_MAX_IDLE', 600, float),
+                'max_lifetime': db_setting('DB_POOL_MAX_LIFETIME', 3600, float),
+            },
+        } if DB_POOL_ENABLED else {},
+    }
+}
+
+# Read replicas, e.g. QNA_DB_REPLICAS=10.0.0.2,10.0.0.3:5433: each one becomes a
+# `replicaN` alias with the primary's credentials. Views decorated with
+# app.routers.replica_reads read from one of them, picked round_robin or by least_latency;
+# a client that has just written reads from the primary for REPLICA_STICKY_SECONDS.
+for number, address in enumerate(filter(None, db_setting('DB_REPLICAS', '').split(',')), start=1):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        # tests run against the primary's test database
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_ROUTERS = ['app.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+REPLICA_SELECTION = db_setting('DB_REPLICA_SELECTION', 'round_robin')
+REPLICA_STICKY_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Pick the backend with QNA_CACHE_BACKEND; the db backend needs `manage.py createcachetable`.
+# locmem is per process: with several workers page purges only reach the worker
+# that made the change (`check --deploy` warns), use db or, on a single host, file
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'qna',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, '.cache'),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'qna_cache',
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[os.environ.get('QNA_CACHE_BACKEND', 'locmem')],
+}
+
+# Sidebar (popular tags / best members) is served from the cache and refreshed
+# in the background once it is older than SIDEBAR_CACHE_TTL seconds
+SIDEBAR_CACHE_TTL = 300
+SIDEBAR_BACKGROUND_REFRESH = True
+
+# Rendered question cards are cached per question version (see app.fragments)
+CARD_CACHE_TTL = 24 * 60 * 60
+
+# Anonymous pages are cached until one of their surrogate keys is purged (see app.surrogates),
+# the TTL only bounds how stale the cached sidebar inside them can get
+PAGE_CACHE_TTL = 5 * 60
+
+# "Hot" questions: log10(rating + ANSWER_WEIGHT * answers) + created_at / TIMESCALE (see app.ranking),
+# i.e. a question 12.5 hours newer needs 10x fewer points; refreshed on every vote/answer, never decayed
+HOT_SCORE_ANSWER_WEIGHT = 2
+HOT_SCORE_TIMESCALE = 45000
+
+# Tag autocomplete is served from an in-process index (see app.tagindex), rebuilt
+# in the background once it is older than this many seconds to pick up other processes' changes
+TAG_INDEX_TTL = 60
+
+# Text search configuration used for the PostgreSQL full-text index
+SEARCH_CONFIG = 'english'
+
+# Per-request query/template profiling (see app.middleware.RequestProfilingMiddleware):
+# the fraction of requests profiled (off unless QNA_PROFILING_SAMPLE_RATE is set,
+# e.g. 0.05 in production), how many slowest statements to report and
+# how many repetitions of one query shape are reported as an N+1 pattern
+REQUEST_PROFILING_SAMPLE_RATE = float(os.environ.get('QNA_PROFILING_SAMPLE_RATE', 0))
+REQUEST_PROFILING_SLOWEST = 3
+REQUEST_PROFILING_REPEAT_THRESHOLD = 5
+
+# Live question page updates over SSE, ASGI with qna_project.urls_async only (see app.events):
+# app.events.LocalBackend for a single worker process,
+# app.events.PostgresNotifyBackend to fan out across processes and hosts;
+# events a stream may have queued before it is evicted, seconds between keep-alives
+EVENTS_BACKEND = os.environ.get('QNA_EVENTS_BACKEND', 'app.events.LocalBackend')
+EVENTS_QUEUE_SIZE = 32
+EVENTS_HEARTBEAT = 15
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'app.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'app.events': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
 
 
@@ -134,6 +278,19 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
 
+# `collectstatic` output: fingerprinted and precompressed (app.staticfiles),
+# served by app.middleware.StaticAssetMiddleware
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'app.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
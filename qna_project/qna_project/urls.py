@@ -13,10 +13,12 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 
 from app import views
+from app.avatars import THUMBNAILS_DIR
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,6 +29,13 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('ask/', views.ask, name='ask'),
     path('question/<int:question_id>', views.question, name='question'),
+    path('question/<int:question_id>/vote', views.vote_question, name='vote_question'),
+    path('answer/<int:answer_id>/vote', views.vote_answer, name='vote_answer'),
     path('tag/<str:tag>', views.tag, name='tag'),
-    path('profile/<str:username>', views.profile, name='profile')
+    path('search/', views.search, name='search'),
+    path('profile/<str:username>', views.profile, name='profile'),
+    path('diagnostics/db-pool', views.db_pool, name='db_pool'),
+    path('api/tags/suggest', views.suggest_tags, name='suggest_tags'),
+    path(f'{settings.MEDIA_URL.lstrip("/")}{THUMBNAILS_DIR}/<int:size>/<str:name>',
+         views.avatar_thumbnail, name='avatar_thumbnail'),
 ]
@@ -0,0 +1,14 @@
+"""
+Opt-in URLconf for the ASGI entry point (QNA_ROOT_URLCONF, see asgi.py): the
+routes of qna_project.urls plus the live question page streams.
+"""
+from django.urls import path
+
+from app import async_views
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = sync_urlpatterns + [
+    # long-lived streams only make sense on the ASGI deployment
+    path('question/<int:question_id>/events', async_views.question_events, name='question_events'),
+]
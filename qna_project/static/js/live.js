@@ -0,0 +1,28 @@
+// Live question page: <div data-events-url="..."> receives new answers and rating changes over SSE
+(() => {
+    const target = document.querySelector('[data-events-url]');
+    if (!target || !window.EventSource) {
+        return;
+    }
+
+    const events = new EventSource(target.dataset.eventsUrl);
+    let newAnswers = 0;
+
+    events.addEventListener('rating', (event) => {
+        const data = JSON.parse(event.data);
+        const widget = document.querySelector(`[data-vote-target="${data.kind}:${data.id}"]`);
+        if (widget) {
+            widget.querySelector('.vote__rating').textContent = data.rating;
+        }
+    });
+
+    events.addEventListener('answer', () => {
+        newAnswers += 1;
+        target.innerHTML = '';
+        const link = document.createElement('a');
+        link.href = window.location.pathname + window.location.search;
+        link.className = 'alert alert-info d-block m-2';
+        link.textContent = `${newAnswers} new answer${newAnswers === 1 ? '' : 's'}, click to load`;
+        target.appendChild(link);
+    });
+})();
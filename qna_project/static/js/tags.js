@@ -0,0 +1,49 @@
+// Tag autocomplete: <input data-suggest-url="..."> holding comma separated tags, suggests the one being typed
+(() => {
+    const input = document.querySelector('[data-suggest-url]');
+    if (!input) {
+        return;
+    }
+    const list = input.parentElement.querySelector('[data-suggestions]');
+    let timer = null;
+
+    const typedTag = () => input.value.split(',').pop().trim();
+
+    const show = (tags) => {
+        list.innerHTML = '';
+        for (const tag of tags) {
+            const item = document.createElement('button');
+            item.type = 'button';
+            item.className = 'list-group-item list-group-item-action d-flex justify-content-between';
+            item.textContent = tag.name;
+            const count = document.createElement('span');
+            count.className = 'text-muted small';
+            count.textContent = tag.questions_count;
+            item.appendChild(count);
+            item.addEventListener('click', () => {
+                const tags = input.value.split(',').slice(0, -1).map((name) => name.trim());
+                input.value = [...tags, tag.name].join(', ') + ', ';
+                list.innerHTML = '';
+                input.focus();
+            });
+            list.appendChild(item);
+        }
+    };
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        const prefix = typedTag();
+        if (!prefix) {
+            show([]);
+            return;
+        }
+        timer = setTimeout(async () => {
+            const response = await fetch(`${input.dataset.suggestUrl}?prefix=${encodeURIComponent(prefix)}`);
+            if (response.ok && typedTag() === prefix) {
+                show((await response.json()).tags);
+            }
+        }, 100);
+    });
+
+    input.addEventListener('blur', () => setTimeout(() => show([]), 200));
+})();
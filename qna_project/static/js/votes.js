@@ -0,0 +1,23 @@
+// Vote buttons: <div data-vote-url="..."> with [data-vote] buttons and a .vote__rating counter
+document.addEventListener('click', async (event) => {
+    const button = event.target.closest('[data-vote]');
+    if (!button) {
+        return;
+    }
+
+    const widget = button.closest('[data-vote-url]');
+    const token = document.querySelector('meta[name="csrf-token"]');
+    const body = new URLSearchParams({ value: button.dataset.vote });
+
+    const response = await fetch(widget.dataset.voteUrl, {
+        method: 'POST',
+        headers: { 'X-CSRFToken': token ? token.content : '' },
+        body: body,
+    });
+    if (!response.ok) {
+        return;
+    }
+
+    const data = await response.json();
+    widget.querySelector('.vote__rating').textContent = data.rating;
+});